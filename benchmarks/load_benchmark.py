@@ -0,0 +1,282 @@
+"""
+Load benchmark of every API route against the in-memory Firestore/Auth backend.
+
+Starts the API in a uvicorn subprocess with FIREBASE_BACKEND=fake (or targets
+a running server with --url), seeds users with notes, then drives each route
+with --concurrency concurrent clients. Reports requests per second, p50/p99
+latency and Firestore round-trips per request, read from the
+X-Firestore-Round-Trips header. Requests are generated from --seed before the
+run, so two runs with the same arguments send the same requests.
+
+Usage:
+    python -m benchmarks.load_benchmark [--requests 500] [--concurrency 32] [--users 20] [--notes 200]
+                                        [--latency-ms 5] [--routes notes.list notes.get] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import httpx
+
+WORDS = (
+    "meeting project budget review draft idea travel recipe garden music invoice "
+    "report launch design sprint retro plan notes todo research reading"
+).split()
+TAGS = ["work", "personal", "ideas", "urgent", "later"]
+SEED_BATCH_SIZE = 400
+
+# (method, path, JSON body, extra headers)
+Request = Tuple[str, str, Optional[dict], Dict[str, str]]
+
+
+def auth_headers(uid: str) -> Dict[str, str]:
+    # The fake Auth backend accepts the uid itself as the ID token
+    return {"Authorization": f"Bearer {uid}"}
+
+
+def sentence(rng: random.Random, length: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+class Dataset:
+    """The seeded users and notes, and the IDs each mutating route works on."""
+
+    def __init__(self, users: int, notes_per_user: int, seed: int):
+        self.rng = random.Random(seed)
+        self.uids = [f"bench-user-{index}" for index in range(users)]
+        self.notes = {uid: [f"{uid}-note-{index}" for index in range(notes_per_user)] for uid in self.uids}
+        self.watermark: Optional[str] = None
+        self._created = 0
+
+    def seed_operations(self, uid: str) -> List[dict]:
+        return [
+            {
+                "op": "create",
+                "id": note_id,
+                "data": {
+                    "title": sentence(self.rng, 3),
+                    "content": sentence(self.rng, 60),
+                    "tags": self.rng.sample(TAGS, self.rng.randint(0, 2)),
+                    "is_favorite": self.rng.random() < 0.2
+                }
+            }
+            for note_id in self.notes[uid]
+        ]
+
+    def user(self) -> str:
+        return self.rng.choice(self.uids)
+
+    def note(self) -> Tuple[str, str]:
+        uid = self.user()
+        return uid, self.rng.choice(self.notes[uid])
+
+    def new_note_id(self, uid: str) -> str:
+        self._created += 1
+        return f"{uid}-bench-{self._created}"
+
+
+def build_scenarios(data: Dataset, count: int) -> Dict[str, List[Request]]:
+    """The requests of each route, in the order the routes are benchmarked."""
+    def repeat(make: Callable[[], Request]) -> List[Request]:
+        return [make() for _ in range(count)]
+
+    def with_user(method: str, path: str, body: Optional[dict] = None) -> Request:
+        return method, path, body, auth_headers(data.user())
+
+    def on_note(method: str, path: str, body: Optional[dict] = None) -> Request:
+        uid, note_id = data.note()
+        return method, path.format(note_id=note_id), body, auth_headers(uid)
+
+    def create() -> Request:
+        uid = data.user()
+        note_id = data.new_note_id(uid)
+        created.append((uid, note_id))
+        return "POST", "/api/notes/", {"id": note_id, "title": sentence(data.rng, 3), "content": sentence(data.rng, 60)}, auth_headers(uid)
+
+    def batch() -> Request:
+        uid = data.user()
+        operations = [{"op": "create", "id": data.new_note_id(uid), "data": {"title": "Batch", "content": sentence(data.rng, 20)}} for _ in range(10)]
+        operations += [{"op": "update", "id": data.rng.choice(data.notes[uid]), "data": {"title": sentence(data.rng, 3)}} for _ in range(10)]
+        return "POST", "/api/notes/batch", {"operations": operations}, auth_headers(uid)
+
+    created: List[Tuple[str, str]] = []
+    scenarios = {
+        "auth.me": repeat(lambda: with_user("GET", "/api/auth/me")),
+        "auth.verify": repeat(lambda: with_user("GET", "/api/auth/verify")),
+        "notes.create": repeat(create),
+        "notes.batch": repeat(batch),
+        "notes.list": repeat(lambda: with_user("GET", "/api/notes/?limit=50")),
+        "notes.list.filtered": repeat(lambda: with_user("GET", f"/api/notes/?limit=50&tag={data.rng.choice(TAGS)}&sort=title")),
+        "notes.get": repeat(lambda: on_note("GET", "/api/notes/{note_id}")),
+        "notes.search": repeat(lambda: with_user("GET", f"/api/notes/search?q={data.rng.choice(WORDS)}+{data.rng.choice(WORDS)[:3]}")),
+        "notes.tags": repeat(lambda: with_user("GET", "/api/notes/tags")),
+        "notes.changes": repeat(lambda: with_user("GET", "/api/notes/changes?since={watermark}")),
+        "notes.export": repeat(lambda: with_user("GET", "/api/notes/export")),
+        "notes.stream": repeat(lambda: with_user("GET", "/api/notes/stream")),
+        "notes.put": repeat(lambda: on_note("PUT", "/api/notes/{note_id}", {"content": sentence(data.rng, 60)})),
+        "notes.patch": repeat(lambda: on_note("PATCH", "/api/notes/{note_id}", {"title": sentence(data.rng, 3)})),
+        "notes.favorite": repeat(lambda: on_note("PATCH", "/api/notes/{note_id}/favorite")),
+        "notes.tags.add": repeat(lambda: on_note("POST", "/api/notes/{note_id}/tags", {"tags": [data.rng.choice(TAGS)]})),
+        "notes.tags.remove": repeat(lambda: on_note("DELETE", f"/api/notes/{{note_id}}/tags/{data.rng.choice(TAGS)}")),
+    }
+    # Deletes remove the notes created by notes.create, so every one of them finds its note
+    scenarios["notes.delete"] = [("DELETE", f"/api/notes/{note_id}", None, auth_headers(uid)) for uid, note_id in created]
+    return scenarios
+
+
+async def send(client: httpx.AsyncClient, request: Request, watermark: str) -> Tuple[float, int, int]:
+    """Send one request; returns its latency, status code and Firestore round-trips."""
+    method, path, body, headers = request
+    path = path.replace("{watermark}", quote(watermark))
+    started = time.perf_counter()
+    if path.endswith("/stream"):
+        # A stream never ends; time it until it opens
+        async with client.stream(method, path, headers=headers) as response:
+            async for _ in response.aiter_bytes():
+                break
+    else:
+        response = await client.request(method, path, json=body, headers=headers)
+    elapsed = time.perf_counter() - started
+    return elapsed, response.status_code, int(response.headers.get("X-Firestore-Round-Trips", 0))
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: List[Request], concurrency: int, watermark: str) -> dict:
+    results: List[Tuple[float, int, int]] = []
+    pending = iter(requests)
+
+    async def worker() -> None:
+        for request in pending:
+            results.append(await send(client, request, watermark))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, status, _ in results if status >= 400),
+        "requests_per_second": round(len(results) / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "firestore_ops_per_request": round(sum(ops for _, _, ops in results) / len(results), 2) if results else 0.0
+    }
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(rank / 100 * len(values))) - 1))]
+
+
+async def seed(client: httpx.AsyncClient, data: Dataset) -> None:
+    for uid in data.uids:
+        operations = data.seed_operations(uid)
+        for start in range(0, len(operations), SEED_BATCH_SIZE):
+            response = await client.post("/api/notes/batch", json={"operations": operations[start:start + SEED_BATCH_SIZE]}, headers=auth_headers(uid))
+            response.raise_for_status()
+    response = await client.get("/api/notes/changes", headers=auth_headers(data.uids[0]))
+    data.watermark = response.json()["data"]["watermark"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, latency_ms: float, search_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "FIREBASE_BACKEND": "fake",
+        "FAKE_FIRESTORE_LATENCY_MS": str(latency_ms),
+        "LOG_LEVEL": "ERROR",
+        "SEARCH_INDEX_DIR": search_dir,
+        # A few seeded users send every request, far above any per-user limit
+        "RATE_LIMIT_ENABLED": "False",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not start")
+        await asyncio.sleep(0.1)
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, dict]:
+    data = Dataset(args.users, args.notes, args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60.0) as client:
+        await wait_until_up(client)
+        await seed(client, data)
+        scenarios = build_scenarios(data, args.requests)
+        results = {}
+        for name, requests in scenarios.items():
+            if args.routes and name not in args.routes:
+                continue
+            results[name] = await run_scenario(client, requests, args.concurrency, data.watermark)
+            print_row(name, results[name])
+        return results
+
+
+def print_row(name: str, result: dict) -> None:
+    print(
+        f"{name:<22} {result['requests']:>8} {result['errors']:>7} {result['requests_per_second']:>9.1f} "
+        f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['firestore_ops_per_request']:>8.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--notes", type=int, default=200, help="Notes seeded per user")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency of each fake Firestore round-trip")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--routes", nargs="+", help="Only benchmark these routes")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as search_dir:
+        if args.url is None:
+            port = free_port()
+            args.url = f"http://127.0.0.1:{port}"
+            server = start_server(port, args.latency_ms, search_dir)
+        try:
+            print(f"{'route':<22} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'ops/req':>8}")
+            results = asyncio.run(benchmark(args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as results_file:
+            json.dump({"arguments": {key: value for key, value in vars(args).items() if key != "json"}, "results": results}, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
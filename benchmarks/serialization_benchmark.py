@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of note list serialization.
+
+Compares the original path (a validated NoteResponse per note, wrapped in
+NotesListResponse and validated again through response_model before JSON
+encoding) with the single-pass serialize_note + ORJSON path.
+
+Usage:
+    python -m benchmarks.serialization_benchmark [--sizes 1000 10000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+import orjson
+from src.core.response import NoteResponse, NotesListResponse, serialize_note
+
+
+def make_notes(count: int) -> list:
+    """Build (note_id, note_data) pairs shaped like Firestore snapshots."""
+    now = datetime.now(timezone.utc)
+    return [
+        (
+            f"note-{index}",
+            {
+                "title": f"Note {index}",
+                "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+                "owner_uid": "benchmark-user",
+                "is_favorite": index % 3 == 0,
+                "tags": ["work", "ideas"] if index % 2 else [],
+                "sync_status": "synced",
+                "version": 1,
+                "last_synced_at": now - timedelta(seconds=index),
+                "created_at": now - timedelta(days=1, seconds=index),
+                "updated_at": now - timedelta(seconds=index)
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def validated_path(notes: list) -> bytes:
+    responses = [
+        NoteResponse(
+            id=note_id,
+            title=note_data["title"],
+            content=note_data["content"],
+            owner_uid=note_data["owner_uid"],
+            is_favorite=note_data["is_favorite"],
+            tags=note_data["tags"],
+            sync_status=note_data["sync_status"],
+            version=note_data["version"],
+            last_synced_at=note_data["last_synced_at"].isoformat(),
+            created_at=note_data["created_at"].isoformat(),
+            updated_at=note_data["updated_at"].isoformat()
+        )
+        for note_id, note_data in notes
+    ]
+    body = NotesListResponse(data=responses, message=f"Retrieved {len(responses)} notes")
+    # What response_model does: dump, validate again, dump for JSON
+    validated = NotesListResponse.model_validate(body.model_dump())
+    return json.dumps(validated.model_dump(mode="json")).encode()
+
+
+def fast_path(notes: list) -> bytes:
+    data = [serialize_note(note_id, note_data) for note_id, note_data in notes]
+    return orjson.dumps({
+        "success": True,
+        "data": data,
+        "next_cursor": None,
+        "message": f"Retrieved {len(data)} notes"
+    })
+
+
+def measure(func, notes: list, repeat: int) -> float:
+    """Best wall time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(notes)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'notes':>8} {'validated µs/note':>18} {'fast µs/note':>14} {'speedup':>8}")
+    for size in args.sizes:
+        notes = make_notes(size)
+        assert json.loads(validated_path(notes)) == json.loads(fast_path(notes))
+        validated = measure(validated_path, notes, args.repeat)
+        fast = measure(fast_path, notes, args.repeat)
+        print(f"{size:>8} {validated / size * 1e6:>18.2f} {fast / size * 1e6:>14.2f} {validated / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
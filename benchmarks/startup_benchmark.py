@@ -0,0 +1,107 @@
+"""
+Cold start benchmark of the API.
+
+Each run starts fresh Python processes and measures:
+  - import: time to import `src.main`, which builds the app
+  - ready: time from spawning a uvicorn worker until /health answers
+  - first request: latency of the first authenticated notes request, which
+    is the first to need the Firebase clients
+  - second request: latency of the same request once everything is warm
+
+By default the worker uses the in-memory backend (FIREBASE_BACKEND=fake),
+which measures the application's own startup work. Use --backend firebase
+with --token to include the Admin SDK initialization against a real project.
+
+Usage:
+    python -m benchmarks.startup_benchmark [--runs 5] [--backend fake|firebase] [--token ID_TOKEN] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import httpx
+from benchmarks.load_benchmark import auth_headers, free_port
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import src.main; print(time.perf_counter() - started)"
+METRICS = ("import", "ready", "first_request", "second_request")
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_server(env: Dict[str, str], headers: Dict[str, str], timeout: float = 60.0) -> Dict[str, float]:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while True:
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError("Server did not start")
+                time.sleep(0.005)
+            ready = time.perf_counter() - started
+
+            latencies = []
+            for _ in range(2):
+                request_started = time.perf_counter()
+                client.get("/api/notes/?limit=50", headers=headers).raise_for_status()
+                latencies.append(time.perf_counter() - request_started)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"ready": ready, "first_request": latencies[0], "second_request": latencies[1]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=("fake", "firebase"), default="fake")
+    parser.add_argument("--token", help="Firebase ID token for the notes requests (--backend firebase)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    if args.backend == "firebase" and not args.token:
+        parser.error("--backend firebase needs --token")
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else auth_headers("bench-user")
+    samples: Dict[str, List[float]] = {metric: [] for metric in METRICS}
+    with tempfile.TemporaryDirectory() as search_dir:
+        env = {**os.environ, "FIREBASE_BACKEND": args.backend, "LOG_LEVEL": "ERROR", "SEARCH_INDEX_DIR": search_dir}
+        for _ in range(args.runs):
+            samples["import"].append(measure_import(env))
+            for metric, value in measure_server(env, headers).items():
+                samples[metric].append(value)
+
+    results = {
+        metric: {
+            "median_ms": round(statistics.median(values) * 1000, 1),
+            "min_ms": round(min(values) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1)
+        }
+        for metric, values in samples.items()
+    }
+    print(f"{'metric':<16} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for metric, result in results.items():
+        print(f"{metric:<16} {result['median_ms']:>10.1f} {result['min_ms']:>10.1f} {result['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as results_file:
+            json.dump({"arguments": {key: value for key, value in vars(args).items() if key not in ("json", "token")}, "results": results}, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from src.core.config import settings
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends used by the services.
+
+    Values are JSON-serializable objects. Backends never raise on lookups or
+    writes: a failing backend behaves like an empty cache.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, record: bool = True) -> Optional[Any]:
+        """Look up a key; `record=False` keeps bookkeeping lookups out of the hit rate."""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU cache bounded by the serialized size of its values.
+
+    Cached values are shared with callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: float):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.size_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+
+    async def get(self, key: str, record: bool = True) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            entry = None
+
+        if record:
+            self._record(entry is not None)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        size = len(key) + len(json.dumps(value, separators=(",", ":"), default=str))
+        self._remove(key)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        self._entries[key] = (expires_at, size, value)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache stored in a Redis-compatible server, shared by every worker.
+
+    Requires the optional `redis` package. Memory limits and eviction are left
+    to the server's own `maxmemory` policy.
+    """
+
+    def __init__(self, url: str, default_ttl: float, key_prefix: str = "notes-api:"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+
+        self.default_ttl = default_ttl
+        self.key_prefix = key_prefix
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str, record: bool = True) -> Optional[Any]:
+        try:
+            raw = await self._client.get(self.key_prefix + key)
+        except Exception as e:
+            logging.warning("Redis cache get failed. Error: %s", e)
+            raw = None
+
+        if record:
+            self._record(raw is not None)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            await self._client.set(
+                self.key_prefix + key,
+                json.dumps(value, separators=(",", ":"), default=str),
+                px=int((ttl if ttl is not None else self.default_ttl) * 1000)
+            )
+        except Exception as e:
+            logging.warning("Redis cache set failed. Error: %s", e)
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            await self._client.delete(*(self.key_prefix + key for key in keys))
+        except Exception as e:
+            logging.warning("Redis cache delete failed. Error: %s", e)
+
+
+def create_cache() -> CacheBackend:
+    """Create the cache backend selected by CACHE_BACKEND."""
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(settings.REDIS_URL, settings.CACHE_TTL_SECONDS)
+    return MemoryCache(settings.CACHE_MAX_BYTES, settings.CACHE_TTL_SECONDS)
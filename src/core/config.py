@@ -1,4 +1,6 @@
+import json
 import os
+from functools import cached_property
 from pathlib import Path
 from pydantic_settings import BaseSettings
 
@@ -7,24 +9,70 @@ class Settings(BaseSettings):
     FIREBASE_SERVICE_ACCOUNT_KEY_PATH: str = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH", "./serviceAccountKey.json")
     FIREBASE_SERVICE_ACCOUNT_KEY: str = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY", "")
     FIREBASE_PROJECT_ID: str = os.getenv("FIREBASE_PROJECT_ID", "")
+    FIREBASE_BACKEND: str = os.getenv("FIREBASE_BACKEND", "firebase")  # firebase | fake (in-memory)
+    FAKE_FIRESTORE_LATENCY_MS: float = float(os.getenv("FAKE_FIRESTORE_LATENCY_MS", "0"))
+    FAKE_FIRESTORE_JITTER_MS: float = float(os.getenv("FAKE_FIRESTORE_JITTER_MS", "0"))
+    FAKE_AUTH_LATENCY_MS: float = float(os.getenv("FAKE_AUTH_LATENCY_MS", "0"))
     
     # App Settings
     APP_NAME: str = os.getenv("APP_NAME", "Notes API")
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # json | text
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # Share of requests whose INFO logs are kept
+    
+    # Authentication
+    TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./notes.db")
+    FIRESTORE_MAX_CONCURRENCY: int = int(os.getenv("FIRESTORE_MAX_CONCURRENCY", "16"))
+    
+    # Cache
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")  # memory | redis
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Search
+    SEARCH_INDEX_DIR: str = os.getenv("SEARCH_INDEX_DIR", "./search_index")
+    SEARCH_MAX_INDEXED_USERS: int = int(os.getenv("SEARCH_MAX_INDEXED_USERS", "1000"))
+    SEARCH_SYNC_INTERVAL_SECONDS: float = float(os.getenv("SEARCH_SYNC_INTERVAL_SECONDS", "5"))
+    
+    # Note content storage
+    CONTENT_COMPRESSION_THRESHOLD_BYTES: int = int(os.getenv("CONTENT_COMPRESSION_THRESHOLD_BYTES", str(16 * 1024)))
+    CONTENT_INLINE_MAX_BYTES: int = int(os.getenv("CONTENT_INLINE_MAX_BYTES", str(512 * 1024)))
+    
+    # Import
+    IMPORT_MAX_BYTES: int = int(os.getenv("IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))  # Decompressed upload size
+    IMPORT_MAX_PARALLEL_COMMITS: int = int(os.getenv("IMPORT_MAX_PARALLEL_COMMITS", "4"))
+    
+    # Write-behind of note updates
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "False").lower() == "true"
+    WRITE_BEHIND_WINDOW_SECONDS: float = float(os.getenv("WRITE_BEHIND_WINDOW_SECONDS", "2"))
+    WRITE_BEHIND_MAX_PENDING_NOTES: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING_NOTES", "1000"))
+    WRITE_BEHIND_MAX_PENDING_BYTES: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING_BYTES", str(32 * 1024 * 1024)))  # Content held in memory
+    
+    # Change stream
+    STREAM_BUFFER_SIZE: int = int(os.getenv("STREAM_BUFFER_SIZE", "1000"))
+    STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    
+    # Rate limiting
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))  # Tokens refilled per user per second
+    RATE_LIMIT_BURST: float = float(os.getenv("RATE_LIMIT_BURST", "200"))  # Tokens a user's bucket holds
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+    MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))  # Per worker; 0 disables the cap
     
     @property
     def firebase_credentials_path(self) -> Path:
         return Path(self.FIREBASE_SERVICE_ACCOUNT_KEY_PATH).resolve()
     
-    @property
+    @cached_property
     def firebase_credentials_dict(self) -> dict:
-        """Get Firebase credentials as dictionary from environment variable."""
+        """Get Firebase credentials as dictionary from environment variable, parsed once."""
         if self.FIREBASE_SERVICE_ACCOUNT_KEY:
-            import json
             return json.loads(self.FIREBASE_SERVICE_ACCOUNT_KEY)
         return None
 
@@ -25,7 +25,8 @@ class CustomHTTPException(HTTPException):
         self,
         status_code: int,
         error_message: str,
-        details: Optional[Dict[str, Any]] = None
+        details: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None
     ):
         self.status_code = status_code
         self.error_message = error_message
@@ -38,7 +39,8 @@ class CustomHTTPException(HTTPException):
                 "statusCode": status_code,
                 "errorMessage": error_message,
                 "details": details
-            }
+            },
+            headers=headers
         )
 
 
@@ -78,6 +80,33 @@ class ValidationError(CustomHTTPException):
         )
 
 
+class ConflictError(CustomHTTPException):
+    def __init__(self, message: str = "Resource was modified concurrently", details: Dict[str, Any] = None):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            error_message=message,
+            details=details
+        )
+
+
+class PayloadTooLargeError(CustomHTTPException):
+    def __init__(self, message: str = "Request body is too large"):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            error_message=message
+        )
+
+
+class RateLimitError(CustomHTTPException):
+    def __init__(self, retry_after: str, message: str = "Too many requests. Please retry later."):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            error_message=message,
+            details={"retry_after_seconds": int(retry_after)},
+            headers={"Retry-After": retry_after}
+        )
+
+
 class InternalServerError(CustomHTTPException):
     def __init__(self, message: str = "Internal server error"):
         super().__init__(
@@ -123,7 +152,8 @@ async def custom_http_exception_handler(request: Request, exc: CustomHTTPExcepti
             "statusCode": exc.status_code,
             "errorMessage": exc.error_message,
             "details": exc.details
-        }
+        },
+        headers=exc.headers
     )
 
 
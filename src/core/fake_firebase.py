@@ -0,0 +1,523 @@
+"""
+In-memory stand-ins for the Firestore client and Firebase Auth.
+
+Selected with FIREBASE_BACKEND=fake to run the API, for example under the
+benchmark suite, without a Firebase project. They implement the subset of
+the SDK this service uses, with the same semantics: server timestamps and
+field transforms, write preconditions, atomic batches, ordered and filtered
+queries with cursors and projections, and snapshot listeners.
+
+Every round-trip sleeps for the configured latency, outside of the store
+lock, so concurrent calls overlap like network calls do.
+"""
+import copy
+import operator
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from firebase_admin import auth
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1 import transforms
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+FAKE_TOKEN_LIFETIME_SECONDS = 3600
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, candidates: value in candidates,
+    "not-in": lambda value, candidates: value not in candidates,
+    "array_contains": lambda value, item: isinstance(value, list) and item in value,
+    "array_contains_any": lambda value, items: isinstance(value, list) and any(item in value for item in items),
+}
+
+
+def _apply_write(current: Optional[dict], data: dict, write_time: datetime, merge: bool = False) -> dict:
+    """Apply field values and transforms to a document, like Firestore does on commit."""
+    result = copy.deepcopy(current) if current is not None else {}
+    for key, value in data.items():
+        *parents, field = key.split(".")
+        target = result
+        for parent in parents:
+            target = target.setdefault(parent, {})
+
+        if value is transforms.SERVER_TIMESTAMP:
+            target[field] = write_time
+        elif value is transforms.DELETE_FIELD:
+            target.pop(field, None)
+        elif isinstance(value, transforms.Increment):
+            target[field] = target.get(field, 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            target[field] = list(target.get(field) or []) + [item for item in value.values if item not in (target.get(field) or [])]
+        elif isinstance(value, transforms.ArrayRemove):
+            target[field] = [item for item in (target.get(field) or []) if item not in value.values]
+        elif isinstance(value, dict):
+            # Nested maps may hold transforms too; set(merge=True) merges them into the stored map
+            nested = target.get(field) if merge and isinstance(target.get(field), dict) else None
+            target[field] = _apply_write(nested, value, write_time, merge)
+        else:
+            target[field] = copy.deepcopy(value)
+    return result
+
+
+class _Precondition:
+    """Write option returned by FakeFirestore.write_option."""
+
+    def __init__(self, exists: Optional[bool] = None, last_update_time: Optional[datetime] = None):
+        self.exists = exists
+        self.last_update_time = last_update_time
+
+
+class _Document:
+    def __init__(self, data: dict, create_time: datetime, update_time: datetime):
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+
+class FakeWriteResult:
+    def __init__(self, update_time: datetime):
+        self.update_time = update_time
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict], document: Optional[_Document] = None):
+        self.reference = reference
+        self._data = data
+        self.create_time = document.create_time if document is not None else None
+        self.update_time = document.update_time if document is not None else None
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str) -> Any:
+        value = self._data
+        for part in field_path.split("."):
+            value = value[part]
+        return value
+
+
+class _ChangeType:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeDocumentChange:
+    def __init__(self, change_type: str, document: FakeDocumentSnapshot):
+        self.type = _ChangeType(change_type)
+        self.document = document
+
+
+class _Store:
+    """Documents by path, shared by every reference of one client."""
+
+    def __init__(self, latency: float, jitter: float):
+        self.documents: Dict[str, _Document] = {}
+        self.listeners: Dict[str, List["FakeWatch"]] = {}
+        self.lock = threading.RLock()
+        self.latency = latency
+        self.jitter = jitter
+        self.round_trips = 0
+        self._last_time: Optional[datetime] = None
+
+    def round_trip(self) -> None:
+        with self.lock:
+            self.round_trips += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def next_time(self) -> datetime:
+        """Strictly increasing commit time, like Firestore's per-document update times."""
+        now = datetime.now(timezone.utc)
+        if self._last_time is not None and now <= self._last_time:
+            now = self._last_time + timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def snapshot(self, path: str, field_paths: Optional[List[str]] = None) -> FakeDocumentSnapshot:
+        reference = FakeDocumentReference(self, path)
+        document = self.documents.get(path)
+        if document is None:
+            return FakeDocumentSnapshot(reference, None)
+        data = copy.deepcopy(document.data)
+        if field_paths is not None:
+            data = {field: value for field, value in data.items() if field in field_paths}
+        return FakeDocumentSnapshot(reference, data, document)
+
+    def write(self, path: str, kind: str, data: Optional[dict], option: Optional[_Precondition], merge: bool, write_time: datetime) -> FakeWriteResult:
+        """Apply one write; the caller holds the lock."""
+        current = self.documents.get(path)
+        if option is not None:
+            if option.exists is True and current is None:
+                raise google_exceptions.NotFound(f"No document to update: {path}")
+            if option.exists is False and current is not None:
+                raise google_exceptions.AlreadyExists(f"Document already exists: {path}")
+            if option.last_update_time is not None and (current is None or current.update_time != option.last_update_time):
+                raise google_exceptions.FailedPrecondition(f"The document was modified: {path}")
+
+        if kind == "create":
+            if current is not None:
+                raise google_exceptions.AlreadyExists(f"Document already exists: {path}")
+            self.documents[path] = _Document(_apply_write(None, data, write_time), write_time, write_time)
+        elif kind == "set":
+            base = current.data if merge and current is not None else None
+            create_time = current.create_time if current is not None else write_time
+            self.documents[path] = _Document(_apply_write(base, data, write_time, merge), create_time, write_time)
+        elif kind == "update":
+            if current is None:
+                raise google_exceptions.NotFound(f"No document to update: {path}")
+            self.documents[path] = _Document(_apply_write(current.data, data, write_time), current.create_time, write_time)
+        else:
+            self.documents.pop(path, None)
+
+        self._notify(path, current, write_time)
+        return FakeWriteResult(write_time)
+
+    def _notify(self, path: str, previous: Optional[_Document], write_time: datetime) -> None:
+        collection_path = path.rsplit("/", 1)[0]
+        listeners = self.listeners.get(collection_path)
+        if not listeners:
+            return
+        document = self.documents.get(path)
+        if document is None and previous is None:
+            return
+        change_type = "REMOVED" if document is None else "ADDED" if previous is None else "MODIFIED"
+        snapshot = FakeDocumentSnapshot(
+            FakeDocumentReference(self, path),
+            copy.deepcopy((document or previous).data),
+            document or previous
+        )
+        for listener in listeners:
+            listener.push([FakeDocumentChange(change_type, snapshot)], write_time)
+
+
+class FakeDocumentReference:
+    def __init__(self, store: _Store, path: str):
+        self._store = store
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    def collection(self, collection_id: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._store, f"{self.path}/{collection_id}")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def get(self, field_paths: Optional[List[str]] = None, transaction=None) -> FakeDocumentSnapshot:
+        self._store.round_trip()
+        with self._store.lock:
+            return self._store.snapshot(self.path, field_paths)
+
+    def _write(self, kind: str, data: Optional[dict] = None, option: Optional[_Precondition] = None, merge: bool = False) -> FakeWriteResult:
+        self._store.round_trip()
+        with self._store.lock:
+            return self._store.write(self.path, kind, data, option, merge, self._store.next_time())
+
+    def create(self, document_data: dict) -> FakeWriteResult:
+        return self._write("create", document_data)
+
+    def set(self, document_data: dict, merge: bool = False) -> FakeWriteResult:
+        return self._write("set", document_data, merge=merge)
+
+    def update(self, field_updates: dict, option: Optional[_Precondition] = None) -> FakeWriteResult:
+        return self._write("update", field_updates, option)
+
+    def delete(self, option: Optional[_Precondition] = None) -> FakeWriteResult:
+        return self._write("delete", option=option)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        store: _Store,
+        path: str,
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit: Optional[int] = None,
+        start_after: Optional[Dict[str, Any]] = None,
+        projection: Optional[List[str]] = None
+    ):
+        self._store = store
+        self._path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+
+    def _copy(self, **changes) -> "FakeQuery":
+        values = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start_after": self._start_after,
+            "projection": self._projection,
+        }
+        values.update(changes)
+        return FakeQuery(self._store, self._path, **values)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields) -> "FakeQuery":
+        if isinstance(document_fields, FakeDocumentSnapshot):
+            document_fields = {"__name__": document_fields.id, **document_fields.to_dict()}
+        return self._copy(start_after=dict(document_fields))
+
+    def select(self, field_paths: List[str]) -> "FakeQuery":
+        return self._copy(projection=list(field_paths))
+
+    def _matches(self, data: dict) -> bool:
+        for field, op_string, value in self._filters:
+            if data.get(field) is None or not _OPERATORS[op_string](data[field], value):
+                return False
+        # Like Firestore, a document without an ordered field is left out
+        return all(field == "__name__" or field in data for field, _ in self._orders)
+
+    def _sort_orders(self) -> List[Tuple[str, str]]:
+        orders = list(self._orders)
+        if all(field != "__name__" for field, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else ASCENDING))
+        return orders
+
+    def stream(self, transaction=None):
+        self._store.round_trip()
+        prefix = self._path + "/"
+        with self._store.lock:
+            matches = [
+                (path, document)
+                for path, document in self._store.documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):] and self._matches(document.data)
+            ]
+            results = [
+                (path.rsplit("/", 1)[-1], self._store.snapshot(path))
+                for path, _ in matches
+            ]
+
+        orders = self._sort_orders()
+
+        def value(document_id: str, snapshot: FakeDocumentSnapshot, field: str) -> Any:
+            return document_id if field == "__name__" else snapshot._data.get(field)
+
+        for field, direction in reversed(orders):
+            results.sort(key=lambda item: value(item[0], item[1], field), reverse=direction == DESCENDING)
+
+        if self._start_after is not None:
+            cursor = self._start_after
+
+            def after_cursor(item) -> bool:
+                for field, direction in orders:
+                    if field not in cursor:
+                        return True
+                    current, bound = value(item[0], item[1], field), cursor[field]
+                    if current != bound:
+                        return current < bound if direction == DESCENDING else current > bound
+                return False
+
+            results = [item for item in results if after_cursor(item)]
+
+        if self._limit is not None:
+            results = results[:self._limit]
+        snapshots = [snapshot for _, snapshot in results]
+        if self._projection is not None:
+            for snapshot in snapshots:
+                snapshot._data = {field: field_value for field, field_value in snapshot._data.items() if field in self._projection}
+        return iter(snapshots)
+
+    def get(self, transaction=None) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store: _Store, path: str):
+        super().__init__(store, path)
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._store, f"{self.path}/{document_id or uuid.uuid4().hex}")
+
+    def on_snapshot(self, callback: Callable) -> "FakeWatch":
+        return FakeWatch(self, callback)
+
+
+class FakeWatch:
+    """
+    Snapshot listener on a collection.
+
+    Like the SDK, it first delivers every existing document as ADDED, then
+    each change, calling `callback(snapshots, changes, read_time)` on its own
+    thread.
+    """
+
+    def __init__(self, collection: FakeCollectionReference, callback: Callable):
+        self._collection = collection
+        self._callback = callback
+        self._queue: "queue.Queue[Optional[Tuple[list, datetime]]]" = queue.Queue()
+        store = collection._store
+        with store.lock:
+            prefix = collection.path + "/"
+            initial = [
+                FakeDocumentChange("ADDED", store.snapshot(path))
+                for path in store.documents
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+            self._queue.put((initial, store.next_time()))
+            store.listeners.setdefault(collection.path, []).append(self)
+        self._thread = threading.Thread(target=self._run, name="fake-firestore-watch", daemon=True)
+        self._thread.start()
+
+    def push(self, changes: List[FakeDocumentChange], read_time: datetime) -> None:
+        self._queue.put((changes, read_time))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            changes, read_time = item
+            self._callback([], changes, read_time)
+
+    def unsubscribe(self) -> None:
+        store = self._collection._store
+        with store.lock:
+            listeners = store.listeners.get(self._collection.path, [])
+            if self in listeners:
+                listeners.remove(self)
+        self._queue.put(None)
+
+
+class FakeWriteBatch:
+    def __init__(self, store: _Store):
+        self._store = store
+        self._writes: List[Tuple[FakeDocumentReference, str, Optional[dict], Optional[_Precondition], bool]] = []
+        self.commit_time: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def create(self, reference: FakeDocumentReference, document_data: dict) -> None:
+        self._writes.append((reference, "create", document_data, None, False))
+
+    def set(self, reference: FakeDocumentReference, document_data: dict, merge: bool = False) -> None:
+        self._writes.append((reference, "set", document_data, None, merge))
+
+    def update(self, reference: FakeDocumentReference, field_updates: dict, option: Optional[_Precondition] = None) -> None:
+        self._writes.append((reference, "update", field_updates, option, False))
+
+    def delete(self, reference: FakeDocumentReference, option: Optional[_Precondition] = None) -> None:
+        self._writes.append((reference, "delete", None, option, False))
+
+    def commit(self) -> List[FakeWriteResult]:
+        """Apply every write at one commit time, or none of them if one fails."""
+        self._store.round_trip()
+        with self._store.lock:
+            saved = dict(self._store.documents)
+            listeners = self._store.listeners
+            self._store.listeners = {}  # Listeners only hear about committed writes
+            commit_time = self._store.next_time()
+            try:
+                results = [
+                    self._store.write(reference.path, kind, data, option, merge, commit_time)
+                    for reference, kind, data, option, merge in self._writes
+                ]
+            except Exception:
+                self._store.documents = saved
+                raise
+            finally:
+                self._store.listeners = listeners
+            for reference, kind, _, _, _ in self._writes:
+                self._store._notify(reference.path, saved.get(reference.path), commit_time)
+        self.commit_time = commit_time
+        return results
+
+
+class FakeFirestore:
+    """In-memory replacement of firestore.client()."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self._store = _Store(latency, jitter)
+
+    @property
+    def round_trips(self) -> int:
+        return self._store.round_trips
+
+    def collection(self, *path: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self._store, "/".join(path))
+
+    def document(self, *path: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self._store, "/".join(path))
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self._store)
+
+    def write_option(self, **kwargs) -> _Precondition:
+        return _Precondition(**kwargs)
+
+    def get_all(self, references: List[FakeDocumentReference], field_paths: Optional[List[str]] = None, transaction=None):
+        self._store.round_trip()
+        with self._store.lock:
+            return [self._store.snapshot(reference.path, field_paths) for reference in references]
+
+
+class FakeAuth:
+    """
+    Replacement of the firebase_admin.auth module for token verification.
+
+    A token is the uid it stands for. Verification sleeps for the configured
+    latency, which stands in for the signature check of a real ID token.
+    """
+
+    InvalidIdTokenError = auth.InvalidIdTokenError
+    ExpiredIdTokenError = auth.ExpiredIdTokenError
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def verify_id_token(self, id_token: str, app=None, check_revoked: bool = False) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        if not id_token or len(id_token) > 128 or any(character.isspace() for character in id_token):
+            raise auth.InvalidIdTokenError("Invalid fake ID token")
+        issued_at = int(time.time())
+        return {
+            "uid": id_token,
+            "email": f"{id_token}@example.com",
+            "name": id_token,
+            "iat": issued_at,
+            "exp": issued_at + FAKE_TOKEN_LIFETIME_SECONDS,
+        }
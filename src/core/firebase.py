@@ -1,17 +1,193 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional
 from src.core.config import settings
+from src.core.metrics import firestore_call_duration, current_operation
 
-# Initialize Firebase Admin SDK
-if settings.firebase_credentials_dict:
-    # Use environment variable (production)
-    cred = credentials.Certificate(settings.firebase_credentials_dict)
-else:
-    # Use file path (local development)
-    cred = credentials.Certificate(settings.firebase_credentials_path)
 
-firebase_admin.initialize_app(cred)
+class FirebaseClients:
+    """
+    The Firestore and Auth clients, created on first use.
+
+    Initializing the Admin SDK and the Firestore client is left out of module
+    import, so a cold worker can start serving as soon as the code is loaded;
+    `warm_up` creates them ahead of the first request from a background
+    thread. Whichever comes first creates them, under a lock, exactly once.
+    """
+
+    def __init__(self):
+        self._firestore = None
+        self._auth = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._firestore is not None
+
+    @property
+    def firestore(self):
+        if self._firestore is None:
+            self._initialize()
+        return self._firestore
+
+    @property
+    def auth(self):
+        if self._auth is None:
+            self._initialize()
+        return self._auth
+
+    def _initialize(self) -> None:
+        with self._lock:
+            if self._firestore is not None:
+                return
+            started = time.perf_counter()
+            if settings.FIREBASE_BACKEND == "fake":
+                # In-memory Firestore and Auth, for benchmarks and local runs without a Firebase project
+                from src.core.fake_firebase import FakeFirestore, FakeAuth
+
+                self._auth = FakeAuth(settings.FAKE_AUTH_LATENCY_MS / 1000)
+                self._firestore = FakeFirestore(settings.FAKE_FIRESTORE_LATENCY_MS / 1000, settings.FAKE_FIRESTORE_JITTER_MS / 1000)
+            else:
+                import firebase_admin
+                from firebase_admin import credentials, firestore, auth
+
+                # Initialize Firebase Admin SDK, unless a failed attempt got that far
+                try:
+                    firebase_admin.get_app()
+                except ValueError:
+                    if settings.firebase_credentials_dict:
+                        # Use environment variable (production)
+                        cred = credentials.Certificate(settings.firebase_credentials_dict)
+                    else:
+                        # Use file path (local development)
+                        cred = credentials.Certificate(settings.firebase_credentials_path)
+                    firebase_admin.initialize_app(cred)
+                self._auth = auth
+                # Set last: `ready` and the unlocked fast path check it
+                self._firestore = firestore.client()
+            logging.info("Firebase clients initialized in %.3fs", time.perf_counter() - started)
+
+    def warm_up(self) -> None:
+        """Create the clients, logging rather than raising a failure so the next use retries."""
+        try:
+            self._initialize()
+        except Exception as e:
+            logging.error("Firebase initialization failed. Error: %s", e)
+
+
+class _LazyClient:
+    """Stand-in for a client that forwards every attribute to it, creating it on first use."""
+
+    def __init__(self, resolve: Callable[[], Any]):
+        self._resolve = resolve
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+
+firebase_clients = FirebaseClients()
 
 # Easy access to Firestore and Auth services
-db = firestore.client()
-firebase_auth = auth
\ No newline at end of file
+db = _LazyClient(lambda: firebase_clients.firestore)
+firebase_auth = _LazyClient(lambda: firebase_clients.auth)
+
+
+class RoundTripCounter:
+    """Number of Firestore round-trips made while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+
+
+_request_round_trips: ContextVar[Optional[RoundTripCounter]] = ContextVar("firestore_round_trips", default=None)
+
+
+@contextmanager
+def track_round_trips() -> Iterator[RoundTripCounter]:
+    """Count the Firestore round-trips made inside the block, including child tasks."""
+    counter = RoundTripCounter()
+    token = _request_round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_round_trips.reset(token)
+
+
+class AsyncFirestore:
+    """
+    Non-blocking access layer over the synchronous Firestore client.
+
+    Every blocking client call is dispatched to a bounded thread pool, so a slow
+    Firestore round-trip never stalls the event loop. The pool size caps the
+    number of concurrent Firestore calls per worker process. Every call is
+    timed, labelled with the service operation that made it.
+
+    The pool is created on first use and again after a shutdown, so apps
+    built one after another in a process, such as one per test, each get one.
+    """
+
+    def __init__(self, client, max_concurrency: int):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.round_trips = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking Firestore call on the pool and await its result."""
+        self.round_trips += 1
+        counter = _request_round_trips.get()
+        if counter is not None:
+            counter.count += 1
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outcome = "error"
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="firestore")
+        try:
+            result = await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            outcome = "ok"
+            return result
+        finally:
+            # Includes the wait for a free pool thread, which is part of the latency the caller sees
+            firestore_call_duration.observe(time.perf_counter() - started, current_operation(), outcome)
+
+    async def get(self, doc_ref, **kwargs):
+        return await self.run(doc_ref.get, **kwargs)
+
+    async def set(self, doc_ref, data: dict, **kwargs):
+        return await self.run(doc_ref.set, data, **kwargs)
+
+    async def update(self, doc_ref, data: dict, **kwargs):
+        return await self.run(doc_ref.update, data, **kwargs)
+
+    async def delete(self, doc_ref, **kwargs):
+        return await self.run(doc_ref.delete, **kwargs)
+
+    async def commit(self, batch) -> List:
+        """Commit a write batch and return its write results."""
+        return await self.run(batch.commit)
+
+    async def get_all(self, doc_refs: List, **kwargs) -> List:
+        """Fetch several documents in a single round-trip."""
+        return await self.run(lambda: list(self.client.get_all(doc_refs, **kwargs)))
+
+    async def stream(self, query, **kwargs) -> List:
+        """Run a query and return all of its snapshots."""
+        return await self.run(lambda: list(query.stream(**kwargs)))
+
+    def shutdown(self) -> None:
+        """Wait for the calls in flight and release the pool."""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Shared async access layer used by the services
+async_db = AsyncFirestore(db, settings.FIRESTORE_MAX_CONCURRENCY)
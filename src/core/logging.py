@@ -1,8 +1,22 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from enum import StrEnum
+from typing import Optional
 
 
 LOG_FORMAT_DEBUG = "%(levelname)s:%(message)s:%(pathname)s:%(funcName)s:%(lineno)d"
+LOG_FORMAT_TEXT = "%(levelname)s:%(request_id)s:%(message)s"
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; newer records are dropped beyond this
+
+# Attributes every LogRecord has; anything else on a record was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "uid"}
 
 
 class LogLevels(StrEnum):
@@ -12,16 +26,130 @@ class LogLevels(StrEnum):
     debug = "DEBUG"
 
 
-def configure_logging(log_level: str = LogLevels.error):
+# Context of the request being handled. It is a mutable dict so values bound by
+# dependencies running in the thread pool are seen by the rest of the request.
+_log_context: ContextVar[Optional[dict]] = ContextVar("log_context", default=None)
+
+
+def start_request_context(request_id: Optional[str] = None) -> str:
+    """Open the log context of a request and return its correlation ID."""
+    request_id = request_id or uuid.uuid4().hex
+    _log_context.set({"request_id": request_id})
+    return request_id
+
+
+def bind_log_context(**values) -> None:
+    """Add values, such as the authenticated uid, to every later record of the current request."""
+    context = _log_context.get()
+    if context is not None:
+        context.update(values)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Attach the request context to records and sample INFO records.
+
+    It runs in the logging thread, before records are queued. Sampling is
+    decided per request, so a sampled request keeps all of its lines; records
+    logged outside of a request and warnings or errors are always kept.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get() or {}
+        record.request_id = context.get("request_id")
+        record.uid = context.get("uid")
+        if self.sample_rate >= 1.0 or record.levelno > logging.INFO or record.request_id is None:
+            return True
+        return zlib.crc32(record.request_id.encode()) / 0xFFFFFFFF < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request context and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.request_id is not None:
+            entry["request_id"] = record.request_id
+        if record.uid is not None:
+            entry["uid"] = record.uid
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records without formatting them.
+
+    The standard QueueHandler merges the message and its arguments before
+    queuing; here that is left to the writer thread, so a log call only costs
+    the filter and a queue put on the calling thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on a slow log sink
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(log_level: str = LogLevels.error, log_format: str = "json", sample_rate: float = 1.0):
+    """
+    Route all logging through a queue drained by a background writer thread.
+
+    `log_format` is `json` for structured records or `text` for local
+    development. `sample_rate` is the share of requests whose INFO records
+    are kept.
+    """
+    global _listener
     log_level = str(log_level).upper()
     log_levels = [level.value for level in LogLevels]
-
     if log_level not in log_levels:
-        logging.basicConfig(level=LogLevels.error)
-        return
+        log_level = LogLevels.error
+
+    stream_handler = logging.StreamHandler()
+    if log_format == "text":
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT_DEBUG if log_level == LogLevels.debug else LOG_FORMAT_TEXT))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = _DeferredQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(ContextFilter(sample_rate))
+
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(log_level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Write the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
-    if log_level == LogLevels.debug:
-        logging.basicConfig(level=log_level, format=LOG_FORMAT_DEBUG)
-        return
 
-    logging.basicConfig(level=log_level)
\ No newline at end of file
+atexit.register(shutdown_logging)
@@ -0,0 +1,182 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from src.core.config import settings
+from src.core.metrics import registry
+
+rate_limited_requests = registry.counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429, by reason",
+    ("reason",)
+)
+
+
+class RateLimitBackend:
+    """
+    Interface of the token bucket stores.
+
+    Every key has a bucket holding up to `burst` tokens that refills at `rate`
+    tokens per second. Backends never raise: a failing backend admits the
+    request, since Firestore and not the limiter is what must stay available.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.allowed = 0
+        self.limited = 0
+
+    async def acquire(self, key: str, cost: float) -> float:
+        """
+        Take `cost` tokens from the bucket of `key`. Returns 0 when the request
+        is admitted, otherwise the seconds until the bucket holds enough tokens.
+        """
+        # A cost above the burst could never be paid
+        retry_after = await self._acquire(key, min(cost, self.burst))
+        if retry_after > 0:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    async def _acquire(self, key: str, cost: float) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "rate": self.rate,
+            "burst": self.burst,
+            "allowed": self.allowed,
+            "limited": self.limited
+        }
+
+
+class MemoryRateLimiter(RateLimitBackend):
+    """
+    Token buckets kept in this process.
+
+    Only the `max_keys` most recently used buckets are kept. A bucket left idle
+    long enough refills completely, which is the state of a forgotten bucket,
+    so evicting the least recently used ones rarely lets extra requests in.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        super().__init__(rate, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, monotonic time)
+
+    async def _acquire(self, key: str, cost: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / self.rate
+
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def stats(self) -> dict:
+        return {**super().stats(), "keys": len(self._buckets), "max_keys": self.max_keys}
+
+
+# Refill, charge and store a bucket in one atomic step, on the server's clock
+# so that instances with skewed clocks share the same buckets correctly
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimiter(RateLimitBackend):
+    """
+    Token buckets stored in a Redis-compatible server, shared by every
+    worker and instance.
+
+    Requires the optional `redis` package. Buckets expire once they would be
+    full again, so idle users leave nothing behind.
+    """
+
+    def __init__(self, url: str, rate: float, burst: float, key_prefix: str = "notes-api:rate:"):
+        super().__init__(rate, burst)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+
+        self.key_prefix = key_prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def _acquire(self, key: str, cost: float) -> float:
+        try:
+            return float(await self._script(keys=[self.key_prefix + key], args=[self.rate, self.burst, cost]))
+        except Exception as e:
+            logging.warning("Redis rate limit check failed. Error: %s", e)
+            return 0.0
+
+
+class ConcurrencyLimiter:
+    """
+    Cap on the requests a worker handles at once.
+
+    Requests over the cap are rejected right away instead of waiting in the
+    worker, where they would only add to the latency of the others and time
+    out on the client anyway. A cap of 0 disables it.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "rejected": self.rejected}
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After value in whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+def create_rate_limiter() -> Optional[RateLimitBackend]:
+    """Create the rate limit backend selected by RATE_LIMIT_BACKEND, or None when rate limiting is off."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter(settings.REDIS_URL, settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST)
+    return MemoryRateLimiter(settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST, settings.RATE_LIMIT_MAX_KEYS)
@@ -1,4 +1,5 @@
-from typing import Any, Optional, Dict, Generic, TypeVar
+import hashlib
+from typing import Any, Iterable, Optional, Dict, Generic, TypeVar, Union
 from pydantic import BaseModel
 
 T = TypeVar("T")
@@ -17,23 +18,164 @@ class ErrorResponse(BaseModel):
     details: Optional[Dict[str, Any]] = None
 
 
+def note_etag(note_id: str, created_at: str, version: int) -> str:
+    """
+    Strong ETag of one version of a note. Every write bumps the version, and
+    the creation time tells apart a note recreated under the same ID. Neither
+    depends on when the write is committed, so the ETag of a buffered update
+    still holds once it is written.
+    """
+    digest = hashlib.sha1(f"{note_id}|{created_at}|{version}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(header: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match or If-Match header lists the given ETag (or `*`)."""
+    if not header or not etag:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def collection_etag(note_etags: Iterable[str]) -> str:
+    """Strong ETag of a list of notes, derived from the ETags of its notes."""
+    digest = hashlib.sha1("|".join(note_etags).encode()).hexdigest()
+    return f'"{digest}"'
+
+
 # Specific response models for different endpoints
 class NoteResponse(BaseModel):
     id: str
     title: str
     content: str
+    content_truncated: bool = False  # content is a preview of a large note
     owner_uid: str
     is_favorite: bool
     tags: list[str]
     sync_status: str
+    version: int
     last_synced_at: str
     created_at: str
     updated_at: str
 
+    @property
+    def etag(self) -> str:
+        return note_etag(self.id, self.created_at, self.version)
+
+
+# Values of fields that notes written by older versions of the API may lack
+NOTE_FIELD_DEFAULTS: Dict[str, Any] = {
+    "version": 0  # Notes written before versioning count as version 0
+}
+
+
+def serialize_note(note_id: str, note_data: dict) -> Dict[str, Any]:
+    """
+    Map a stored note to its JSON-ready NoteResponse shape in a single pass.
+
+    The result needs no further validation: it can be sent as-is on the fast
+    JSON path or wrapped with NoteResponse.model_construct. Large notes read
+    without reassembling their content carry its preview instead.
+    """
+    truncated = "content_encoding" in note_data
+    return {
+        "id": note_id,
+        "title": note_data["title"],
+        "content": note_data["content_preview"] if truncated else note_data["content"],
+        "content_truncated": truncated,
+        "owner_uid": note_data["owner_uid"],
+        "is_favorite": note_data["is_favorite"],
+        "tags": note_data["tags"],
+        "sync_status": note_data["sync_status"],
+        "version": note_data.get("version", NOTE_FIELD_DEFAULTS["version"]),
+        "last_synced_at": note_data["last_synced_at"].isoformat(),
+        "created_at": note_data["created_at"].isoformat(),
+        "updated_at": note_data["updated_at"].isoformat()
+    }
+
+
+class NotesPage(BaseModel):
+    """A page of notes, already serialized by serialize_note (or projected)."""
+    notes: list[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    etag: str
+
+
+class NoteChangesPage(BaseModel):
+    """Notes and tombstones changed since a watermark, already serialized."""
+    notes: list[Dict[str, Any]]
+    deleted: list[Dict[str, Any]]
+    watermark: Optional[str] = None
+
+
+class NoteSearchPage(BaseModel):
+    """A page of search results, already serialized, with their scores."""
+    notes: list[Dict[str, Any]]
+    total: int
+    next_offset: Optional[int] = None
+
 
 class NotesListResponse(BaseModel):
     success: bool = True
-    data: list[NoteResponse]
+    # Notes are plain dicts when a field projection was requested
+    data: list[Union[NoteResponse, Dict[str, Any]]]
+    next_cursor: Optional[str] = None
+    message: Optional[str] = None
+
+
+class NoteSearchHit(NoteResponse):
+    score: float
+
+
+class NoteSearchResponse(BaseModel):
+    success: bool = True
+    data: list[NoteSearchHit]
+    total: int
+    next_offset: Optional[int] = None
+    message: Optional[str] = None
+
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
+
+class TagCountsResponse(BaseModel):
+    success: bool = True
+    data: list[TagCount]
+    message: Optional[str] = None
+
+
+class DeletedNoteResponse(BaseModel):
+    id: str
+    deleted_at: str
+
+
+class NoteChanges(BaseModel):
+    notes: list[NoteResponse]
+    deleted: list[DeletedNoteResponse]
+    watermark: Optional[str] = None
+
+
+class NoteChangesResponse(BaseModel):
+    success: bool = True
+    data: NoteChanges
+    message: Optional[str] = None
+
+
+class NoteBatchItemResult(BaseModel):
+    id: str
+    op: str
+    success: bool
+    statusCode: int
+    errorMessage: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
+    data: Optional[NoteResponse] = None
+
+
+class NoteBatchResponse(BaseModel):
+    success: bool = True
+    data: list[NoteBatchItemResult]
     message: Optional[str] = None
 
 
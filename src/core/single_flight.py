@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller of a key runs the call; callers arriving while it is in
+    flight wait for the same result, or the same exception, instead of
+    repeating it. Calls are grouped by scope, such as a uid: `invalidate`
+    detaches the calls in flight for a scope, so a caller arriving after a
+    write never joins a read that may have started before it.
+
+    The call runs in its own task, so a caller that disconnects does not
+    cancel the call for the others. Results are shared between callers and
+    must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Dict[str, asyncio.Future]] = {}  # scope -> key -> call in flight
+        self._counts: Dict[str, Dict[str, int]] = {}  # operation -> executed / coalesced
+
+    async def do(self, operation: str, scope: str, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        counts = self._counts.setdefault(operation, {"executed": 0, "coalesced": 0})
+        flights = self._flights.setdefault(scope, {})
+        flight_key = f"{operation}:{key}"
+        flight = flights.get(flight_key)
+        if flight is not None:
+            counts["coalesced"] += 1
+            return await asyncio.shield(flight)
+
+        counts["executed"] += 1
+        flight = asyncio.ensure_future(call())
+        flights[flight_key] = flight
+        flight.add_done_callback(lambda _: self._land(scope, flight_key, flight))
+        return await asyncio.shield(flight)
+
+    def _land(self, scope: str, flight_key: str, flight: asyncio.Future) -> None:
+        flights = self._flights.get(scope)
+        # An invalidated scope may already hold a newer call for the key
+        if flights is not None and flights.get(flight_key) is flight:
+            del flights[flight_key]
+            if not flights:
+                del self._flights[scope]
+        if not flight.cancelled():
+            # Mark the exception retrieved when every caller has gone away
+            flight.exception()
+
+    def invalidate(self, scope: str) -> None:
+        """Let calls in flight for the scope finish, but start new ones for later callers."""
+        self._flights.pop(scope, None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": sum(len(flights) for flights in self._flights.values()),
+            "operations": {operation: dict(counts) for operation, counts in self._counts.items()}
+        }
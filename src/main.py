@@ -1,38 +1,186 @@
-from fastapi import FastAPI
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
-from src.core.logging import configure_logging, LogLevels
+from src.core.logging import configure_logging, shutdown_logging, start_request_context, LogLevels
 from src.core.config import settings
+from src.core.firebase import async_db, firebase_clients, track_round_trips
+from src.core.metrics import registry, http_request_duration
+from src.core.rate_limit import ConcurrencyLimiter, rate_limited_requests, retry_after_header
 from src.core.routes import register_routes, register_exception_handlers
+from src.modules.auth.service import token_cache, rate_limiter
+from src.modules.notes.service import note_cache, note_reads, note_writes, search_index, change_feed
 
-# Configure logging
-configure_logging(settings.LOG_LEVEL)
 
-app = FastAPI(title="Notes API", version="1.0.0")
+def _collect_runtime_stats():
+    """Cache, search index, change stream and admission statistics, read when /metrics is scraped."""
+    caches = {"token": token_cache.stats(), "note": note_cache.stats()}
+    yield "cache_hits_total", "counter", "Cache lookups that found an entry", [({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+    yield "cache_misses_total", "counter", "Cache lookups that missed", [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    yield "cache_hit_ratio", "gauge", "Share of cache lookups that found an entry", [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()]
+    yield "firestore_round_trips_total", "counter", "Firestore calls made by this worker", [({}, async_db.round_trips)]
+    search_stats = search_index.stats()
+    yield "search_indexed_users", "gauge", "Users with a search index in memory", [({}, search_stats["indexed_users"])]
+    yield "search_indexed_notes", "gauge", "Notes in the in-memory search indexes", [({}, search_stats["indexed_notes"])]
+    feed_stats = change_feed.stats()
+    yield "stream_active_users", "gauge", "Users with a note change listener", [({}, feed_stats["active_users"])]
+    yield "stream_connections", "gauge", "Open change stream connections", [({}, feed_stats["connections"])]
+    read_stats = note_reads.stats()
+    yield "single_flight_calls_total", "counter", "Note reads that ran (executed) or shared an identical read in flight (coalesced)", [
+        ({"operation": operation, "result": result}, count)
+        for operation, counts in read_stats["operations"].items()
+        for result, count in counts.items()
+    ]
+    yield "single_flight_in_flight", "gauge", "Distinct note reads in flight", [({}, read_stats["in_flight"])]
+    if note_writes is not None:
+        write_stats = note_writes.stats()
+        yield "write_behind_pending_notes", "gauge", "Notes with buffered updates", [({}, write_stats["pending_notes"])]
+        yield "write_behind_updates_total", "counter", "Note updates buffered", [({}, write_stats["updates"])]
+        yield "write_behind_flushes_total", "counter", "Buffered notes written, each in one commit", [({}, write_stats["flushes"])]
+        yield "write_behind_dropped_total", "counter", "Buffered notes whose updates were dropped, as the note was deleted or changed under conditional updates", [({}, write_stats["dropped"])]
+    yield "http_requests_in_flight", "gauge", "Requests being handled, out of MAX_CONCURRENT_REQUESTS", [({}, admission.in_flight)]
 
-# CORS (Cross-Origin Resource Sharing) Middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Register all routes and exception handlers
-register_routes(app)
-register_exception_handlers(app)
+registry.add_collector(_collect_runtime_stats)
+
+
+# Caller-provided request IDs are echoed in a header, so only plain tokens are accepted
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._\-]{1,128}")
+
+# Requests handled at once by this worker; probes stay outside of the cap
+admission = ConcurrencyLimiter(settings.MAX_CONCURRENT_REQUESTS)
+UNLIMITED_PATHS = {"/", "/health", "/metrics"}
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start creating the Firebase clients without holding up startup, and on
+    shutdown write the buffered note updates, stop the listeners, drain
+    in-flight Firestore calls, save the search indexes and flush the logs
+    before the worker exits.
+    """
+    warm_up = asyncio.get_running_loop().run_in_executor(None, firebase_clients.warm_up)
+    yield
+    await warm_up
+    if note_writes is not None:
+        await note_writes.flush_all()
+    change_feed.close()
+    async_db.shutdown()
+    search_index.save_all()
+    shutdown_logging()
+
+
+# Tag the request's logs with a correlation ID, report the Firestore round-trips
+# it made and record its latency per route
+async def instrument_requests(request: Request, call_next):
+    started = time.perf_counter()
+    # A caller-provided ID ties our logs to the caller's own
+    caller_request_id = request.headers.get("X-Request-ID", "")
+    request_id = start_request_context(caller_request_id if REQUEST_ID_PATTERN.fullmatch(caller_request_id) else None)
+    with track_round_trips() as round_trips:
+        response = await call_next(request)
+    # Streaming responses are timed until their headers are sent
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    # Route templates keep the label set bounded; unmatched paths share one label
+    http_request_duration.observe(elapsed, request.method, route.path if route is not None else "unmatched", str(response.status_code))
+    response.headers["X-Firestore-Round-Trips"] = str(round_trips.count)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+# Shed load once the worker is at its concurrency cap, before any
+# authentication or Firestore work is spent on the request
+async def limit_concurrency(request: Request, call_next):
+    if request.url.path in UNLIMITED_PATHS:
+        return await call_next(request)
+    if not admission.try_acquire():
+        rate_limited_requests.inc("overload")
+        retry_after = retry_after_header(OVERLOAD_RETRY_AFTER_SECONDS)
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={
+                "success": False,
+                "statusCode": status.HTTP_429_TOO_MANY_REQUESTS,
+                "errorMessage": "Server is busy. Please retry later.",
+                "details": {"retry_after_seconds": int(retry_after)}
+            },
+            headers={"Retry-After": retry_after}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        # Streaming responses give their slot back once their headers are sent
+        admission.release()
+
 
-@app.get("/", include_in_schema=False)
 async def read_root():
     return {"message": "Welcome to the Notes API. \n This API Made by Osmangazi YILDIZ"}
 
-@app.get("/health", include_in_schema=False)
+
+async def metrics():
+    """Metrics of this worker in the Prometheus text exposition format."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 async def health_check():
     """Health check endpoint for monitoring and load balancers."""
     return {
         "status": "healthy",
         "service": "Notes API",
         "version": "1.0.0",
-        "timestamp": datetime.utcnow().isoformat() + "Z"
-    }
\ No newline at end of file
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "firebase_ready": firebase_clients.ready,
+        "token_cache": token_cache.stats(),
+        "note_cache": note_cache.stats(),
+        "note_reads": note_reads.stats(),
+        "note_writes": note_writes.stats() if note_writes is not None else None,
+        "search_index": search_index.stats(),
+        "change_feed": change_feed.stats(),
+        "admission": admission.stats(),
+        "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+        "firestore_round_trips": async_db.round_trips
+    }
+
+
+def create_app() -> FastAPI:
+    """
+    Build the application.
+
+    Creating it does no network or Firebase work; the Firebase clients are
+    created in the background once the worker starts, or by the first request
+    that needs them, whichever comes first.
+    """
+    configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_SAMPLE_RATE)
+
+    app = FastAPI(title="Notes API", version="1.0.0", lifespan=lifespan)
+
+    # CORS (Cross-Origin Resource Sharing) Middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # The last middleware added runs first, so shed requests are timed and tagged too
+    app.middleware("http")(limit_concurrency)
+    app.middleware("http")(instrument_requests)
+
+    # Register all routes and exception handlers
+    register_routes(app)
+    register_exception_handlers(app)
+
+    app.add_api_route("/", read_root, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/health", health_check, methods=["GET"], include_in_schema=False)
+    return app
+
+
+app = create_app()
@@ -8,7 +8,7 @@ router = APIRouter(
 )
 
 # Authentication endpoints
-@router.get("/me")
+@router.get("/me", dependencies=[Depends(AuthService.rate_limited(1))])
 async def get_current_user(current_user: TokenData = Depends(AuthService.get_current_user_data)):
     """Get current user information."""
     return {
@@ -18,7 +18,7 @@ async def get_current_user(current_user: TokenData = Depends(AuthService.get_cur
     }
 
 @router.get("/verify")
-async def verify_token(current_uid: str = Depends(AuthService.get_current_user_uid)):
+async def verify_token(current_uid: str = Depends(AuthService.rate_limited(1))):
     """Verify if token is valid."""
     return {
         "success": True,
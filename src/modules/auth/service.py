@@ -1,13 +1,43 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from firebase_admin.auth import InvalidIdTokenError, ExpiredIdTokenError
 from src.core.firebase import firebase_auth
-from src.core.error_handling import UnauthorizedError
+from src.core.error_handling import UnauthorizedError, RateLimitError
+from src.core.config import settings
+from src.core.metrics import auth_verify_duration
+from src.core.rate_limit import create_rate_limiter, rate_limited_requests, retry_after_header
+from src.core.logging import bind_log_context
 from src.modules.auth.models import TokenData
+from src.modules.auth.token_cache import TokenCache
+from typing import Awaitable, Callable
 import logging
+import time
 
 security = HTTPBearer()
 
+# Verified tokens shared by every auth dependency
+token_cache = TokenCache(settings.TOKEN_CACHE_MAX_SIZE)
+
+# Per-user token buckets charged by rate-limited routes; None when rate limiting is off
+rate_limiter = create_rate_limiter()
+
 class AuthService:
+    @staticmethod
+    def verify_token(id_token: str) -> dict:
+        """
+        Verify a Firebase ID token, reusing the cached result when the same
+        token has already been verified and has not expired yet.
+        """
+        decoded_token = token_cache.get(id_token)
+        if decoded_token is None:
+            started = time.perf_counter()
+            try:
+                decoded_token = firebase_auth.verify_id_token(id_token)
+            finally:
+                auth_verify_duration.observe(time.perf_counter() - started)
+            token_cache.put(id_token, decoded_token)
+        return decoded_token
+
     @staticmethod
     def get_current_user_uid(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
         """
@@ -15,30 +45,49 @@ class AuthService:
         If it is not verified, it will throw a HTTP 401 error.
         """
         try:
-            decoded_token = firebase_auth.verify_id_token(credentials.credentials)
+            decoded_token = AuthService.verify_token(credentials.credentials)
             uid = decoded_token['uid']
-            logging.info(f"User {uid} authenticated successfully")
+            bind_log_context(uid=uid)
+            logging.info("User %s authenticated successfully", uid)
             return uid
-        except firebase_auth.InvalidIdTokenError:
+        except InvalidIdTokenError:
             logging.warning("Invalid or expired token provided")
             raise UnauthorizedError("Invalid or expired token. Please login again.")
-        except firebase_auth.ExpiredIdTokenError:
+        except ExpiredIdTokenError:
             logging.warning("Expired token provided")
             raise UnauthorizedError("Token has expired. Please login again.")
         except Exception as e:
-            logging.error(f"Authentication error: {str(e)}")
+            logging.error("Authentication error: %s", e)
             raise UnauthorizedError("Invalid authentication credentials")
 
+    @staticmethod
+    def rate_limited(cost: float) -> Callable[..., Awaitable[str]]:
+        """
+        Dependency returning the caller's uid, like `get_current_user_uid`,
+        once `cost` tokens are taken from the caller's rate limit bucket.
+        If the bucket is short, it will throw a HTTP 429 error with Retry-After.
+        """
+        async def charge_user(current_uid: str = Depends(AuthService.get_current_user_uid)) -> str:
+            if rate_limiter is not None:
+                retry_after = await rate_limiter.acquire(current_uid, cost)
+                if retry_after > 0:
+                    rate_limited_requests.inc("user")
+                    logging.warning("Rate limit exceeded by user %s", current_uid)
+                    raise RateLimitError(retry_after_header(retry_after))
+            return current_uid
+        return charge_user
+
     @staticmethod
     def get_current_user_data(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
         """
         Verify the Bearer token and return full user data.
         """
         try:
-            decoded_token = firebase_auth.verify_id_token(credentials.credentials)
+            decoded_token = AuthService.verify_token(credentials.credentials)
             uid = decoded_token['uid']
             email = decoded_token.get('email')
             name = decoded_token.get('name')
+            bind_log_context(uid=uid)
             
             user_data = TokenData(
                 uid=uid,
@@ -46,14 +95,14 @@ class AuthService:
                 name=name
             )
             
-            logging.info(f"User {uid} data retrieved successfully")
+            logging.info("User %s data retrieved successfully", uid)
             return user_data
-        except firebase_auth.InvalidIdTokenError:
+        except InvalidIdTokenError:
             logging.warning("Invalid or expired token provided")
             raise UnauthorizedError("Invalid or expired token. Please login again.")
-        except firebase_auth.ExpiredIdTokenError:
+        except ExpiredIdTokenError:
             logging.warning("Expired token provided")
             raise UnauthorizedError("Token has expired. Please login again.")
         except Exception as e:
-            logging.error(f"Authentication error: {str(e)}")
+            logging.error("Authentication error: %s", e)
             raise UnauthorizedError("Invalid authentication credentials")
@@ -1,22 +1,67 @@
-from fastapi import APIRouter, Depends, status
-from src.modules.notes.models import NoteCreate, NoteUpdate
+import logging
+import zlib
+import orjson
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from src.modules.notes.models import NoteCreate, NoteUpdate, NoteBatchRequest, NoteTagsUpdate, NoteFilters, MAX_TAG_LENGTH
 from src.modules.auth.service import AuthService
 from src.core.response import (
     NoteCreateResponse,
     NotesListResponse,
+    NoteChangesResponse,
+    NoteSearchResponse,
+    TagCountsResponse,
+    NoteBatchResponse,
     NoteUpdateResponse,
-    NoteDeleteResponse
+    NoteDeleteResponse,
+    etag_matches
 )
-from src.modules.notes.service import NoteService
+from src.modules.notes.service import NoteService, MAX_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE
+from src.modules.notes.stream import parse_event_id
+from src.modules.notes.importer import spool_upload, iter_ndjson, iter_markdown_zip
+from src.core.config import settings
+from src.core.error_handling import ValidationError
 
 router = APIRouter(
     prefix="/api/notes",
     tags=["Notes"]
 )
 
+# Rate limit tokens charged per request, in line with the Firestore reads and
+# writes a request can make
+READ_COST = 1
+WRITE_COST = 2
+LIST_COST = 5
+SEARCH_COST = 5
+CHANGES_COST = 5
+STREAM_COST = 5
+BATCH_COST = 20
+EXPORT_COST = 50
+IMPORT_COST = 50
+
+UPLOAD_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip"
+}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
+
+def _cache_headers(etag: str) -> dict:
+    # Clients may keep the response but must revalidate it before reuse
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
 # Create a new note
 @router.post("/", response_model=NoteCreateResponse, status_code=status.HTTP_201_CREATED)
-async def create_note(note: NoteCreate, current_uid: str = Depends(AuthService.get_current_user_uid)):
+async def create_note(note: NoteCreate, current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))):
     """Create a new note."""
     note_response = await NoteService.create_note(note, current_uid)
     return NoteCreateResponse(
@@ -24,31 +69,271 @@ async def create_note(note: NoteCreate, current_uid: str = Depends(AuthService.g
         message="Note created successfully"
     )
 
+# Apply several create/update/delete operations at once
+@router.post("/batch", response_model=NoteBatchResponse)
+async def apply_batch(batch: NoteBatchRequest, current_uid: str = Depends(AuthService.rate_limited(BATCH_COST))):
+    """Apply a list of note operations with batched writes and return a result per operation."""
+    results = await NoteService.apply_batch(batch.operations, current_uid)
+    succeeded = sum(1 for result in results if result.success)
+    return NoteBatchResponse(
+        data=results,
+        message=f"Applied {succeeded} of {len(results)} operations"
+    )
+
 # Get all notes for the logged in user
 @router.get("/", response_model=NotesListResponse)
-async def get_user_notes(current_uid: str = Depends(AuthService.get_current_user_uid)):
-    """List all notes for the logged in user."""
-    notes = await NoteService.get_user_notes(current_uid)
-    return NotesListResponse(
-        data=notes,
-        message=f"Retrieved {len(notes)} notes"
+async def get_user_notes(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of notes to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor value from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,title,updated_at,is_favorite"),
+    tag: Optional[str] = Query(None, min_length=1, max_length=MAX_TAG_LENGTH, description="Only return notes with this tag"),
+    favorite: Optional[bool] = Query(None, description="Only return favorite (true) or non-favorite (false) notes"),
+    updated_after: Optional[datetime] = Query(None, description="Only return notes updated after this time"),
+    updated_before: Optional[datetime] = Query(None, description="Only return notes updated before this time"),
+    sort: Literal["updated_at", "created_at", "title"] = Query("updated_at", description="Field to sort by"),
+    order: Optional[Literal["asc", "desc"]] = Query(None, description="Sort direction; newest first for dates and A-Z for titles by default"),
+    include: Optional[Literal["content"]] = Query(None, description="`content` to return the full content of large notes instead of a preview"),
+    if_none_match: Optional[str] = Header(None),
+    current_uid: str = Depends(AuthService.rate_limited(LIST_COST))
+):
+    """
+    List the notes of the logged in user, most recently updated first by default.
+    Returns 304 Not Modified when If-None-Match matches the page ETag.
+    """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    filters = NoteFilters(
+        tag=tag.strip().lower() if tag else None,
+        favorite=favorite,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        sort=sort,
+        order=order
+    )
+    include_content = include == "content"
+
+    # A cached page ETag answers a matching revalidation without reading any notes
+    if if_none_match:
+        cached_etag = await NoteService.get_cached_notes_etag(current_uid, limit, cursor, field_list, filters, include_content)
+        if etag_matches(if_none_match, cached_etag):
+            return _not_modified(cached_etag)
+
+    page = await NoteService.get_user_notes(current_uid, limit, cursor, field_list, filters, include_content)
+    if etag_matches(if_none_match, page.etag):
+        return _not_modified(page.etag)
+
+    # Notes are already serialized, so skip response_model validation and encode directly
+    return ORJSONResponse(
+        {
+            "success": True,
+            "data": page.notes,
+            "next_cursor": page.next_cursor,
+            "message": f"Retrieved {len(page.notes)} notes"
+        },
+        headers=_cache_headers(page.etag)
+    )
+
+# Export all notes of the logged in user as NDJSON
+@router.get("/export", response_class=StreamingResponse)
+async def export_notes(
+    gzip: bool = Query(False, description="Compress the export with gzip"),
+    current_uid: str = Depends(AuthService.rate_limited(EXPORT_COST))
+):
+    """Stream every note as one JSON object per line, optionally gzip-compressed."""
+    async def ndjson_lines() -> AsyncIterator[bytes]:
+        try:
+            async for note in NoteService.export_notes(current_uid):
+                yield orjson.dumps(note) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure as the last record
+            logging.error("Failed to export notes for user %s. Error: %s", current_uid, e)
+            yield orjson.dumps({"success": False, "errorMessage": "Export interrupted. Please try again."}) + b"\n"
+
+    async def gzip_lines() -> AsyncIterator[bytes]:
+        compressor = zlib.compressobj(wbits=31)  # gzip container
+        first_line = True
+        async for line in ndjson_lines():
+            chunk = compressor.compress(line)
+            if first_line:
+                # Push the first record out right away instead of waiting for a full deflate block
+                chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+                first_line = False
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+    headers = {"Content-Disposition": 'attachment; filename="notes-export.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        gzip_lines() if gzip else ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+# Import notes from an NDJSON file or a zip of Markdown files
+@router.post("/import", response_class=StreamingResponse)
+async def import_notes(
+    request: Request,
+    upload_format: Optional[Literal["ndjson", "zip"]] = Query(None, alias="format", description="Upload format, taken from Content-Type when omitted"),
+    current_uid: str = Depends(AuthService.rate_limited(IMPORT_COST))
+):
+    """
+    Create notes from the request body and stream the progress back as NDJSON.
+
+    Notes whose ID already exists are skipped, so an interrupted import can
+    be sent again to resume it.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    upload_format = upload_format or UPLOAD_FORMATS.get(content_type)
+    if upload_format is None:
+        raise ValidationError("Unsupported upload type. Send NDJSON or a zip of Markdown files.", {"content_type": content_type})
+
+    upload = await spool_upload(request.stream(), request.headers.get("content-encoding"), settings.IMPORT_MAX_BYTES)
+
+    async def progress_lines(records) -> AsyncIterator[bytes]:
+        try:
+            async for event in NoteService.import_notes(records, current_uid):
+                yield orjson.dumps(event) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure as the last record
+            logging.error("Failed to import notes for user %s. Error: %s", current_uid, e)
+            yield orjson.dumps({"type": "error", "success": False, "errorMessage": "Import interrupted. Send the upload again to resume."}) + b"\n"
+        finally:
+            upload.close()
+
+    try:
+        records = iter_ndjson(upload) if upload_format == "ndjson" else iter_markdown_zip(upload)
+        # The body may never be iterated, e.g. when the client is gone before it starts; the task closes the spool then
+        return StreamingResponse(progress_lines(records), media_type="application/x-ndjson", background=BackgroundTask(upload.close))
+    except BaseException:
+        upload.close()
+        raise
+
+# Get the notes changed since the last sync
+@router.get("/changes", response_model=NoteChangesResponse)
+async def get_changes(
+    since: Optional[datetime] = Query(None, description="watermark returned by the previous sync"),
+    current_uid: str = Depends(AuthService.rate_limited(CHANGES_COST))
+):
+    """Get notes changed or deleted since the given watermark, plus the new watermark."""
+    changes = await NoteService.get_changes(current_uid, since)
+    # Notes are already serialized, so skip response_model validation and encode directly
+    return ORJSONResponse({
+        "success": True,
+        "data": {
+            "notes": changes.notes,
+            "deleted": changes.deleted,
+            "watermark": changes.watermark
+        },
+        "message": f"Retrieved {len(changes.notes)} changed and {len(changes.deleted)} deleted notes"
+    })
+
+# Push note changes to the client as Server-Sent Events
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_changes(
+    last_event_id: Optional[str] = Header(None),
+    current_uid: str = Depends(AuthService.rate_limited(STREAM_COST))
+):
+    """
+    Stream `created`, `updated` and `deleted` note events as Server-Sent Events.
+    Reconnect with the Last-Event-ID header to receive the events missed in between.
+    """
+    if last_event_id:
+        try:
+            parse_event_id(last_event_id)
+        except ValueError:
+            raise ValidationError("Invalid Last-Event-ID")
+
+    async def sse_events() -> AsyncIterator[bytes]:
+        yield b"retry: 3000\n\n"
+        try:
+            async for event in NoteService.stream_changes(current_uid, last_event_id):
+                if event is None:
+                    # Comment line that keeps proxies from closing an idle connection
+                    yield b": keep-alive\n\n"
+                    continue
+                message = f"id: {event['id']}\n".encode() if event["id"] else b""
+                yield message + f"event: {event['event']}\n".encode() + b"data: " + orjson.dumps(event["data"]) + b"\n\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure as the last event
+            logging.error("Failed to stream changes for user %s. Error: %s", current_uid, e)
+            yield b"event: error\ndata: " + orjson.dumps({"errorMessage": "Stream interrupted. Please reconnect."}) + b"\n\n"
+
+    return StreamingResponse(
+        sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
+# Get every tag of the logged in user with its note count
+@router.get("/tags", response_model=TagCountsResponse)
+async def get_tag_counts(current_uid: str = Depends(AuthService.rate_limited(READ_COST))):
+    """Get the tags of the logged in user with the number of notes carrying each, most used first."""
+    tag_counts = await NoteService.get_tag_counts(current_uid)
+    return TagCountsResponse(
+        data=tag_counts,
+        message=f"Retrieved {len(tag_counts)} tags"
+    )
+
+# Search notes by title and content
+@router.get("/search", response_model=NoteSearchResponse)
+async def search_notes(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for; the last letters of a word may be omitted"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_PAGE_SIZE, description="Maximum number of results to return"),
+    offset: int = Query(0, ge=0, description="next_offset value from the previous page"),
+    current_uid: str = Depends(AuthService.rate_limited(SEARCH_COST))
+):
+    """Search the notes of the logged in user, best matches first."""
+    results = await NoteService.search_notes(current_uid, q, limit, offset)
+    # Notes are already serialized, so skip response_model validation and encode directly
+    return ORJSONResponse({
+        "success": True,
+        "data": results.notes,
+        "total": results.total,
+        "next_offset": results.next_offset,
+        "message": f"Found {results.total} matching notes"
+    })
+
 # Get a specific note by ID
 @router.get("/{note_id}", response_model=NoteUpdateResponse)
-async def get_note_by_id(note_id: str, current_uid: str = Depends(AuthService.get_current_user_uid)):
-    """Get a specific note by ID. Only the note owner can access it."""
+async def get_note_by_id(
+    note_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_uid: str = Depends(AuthService.rate_limited(READ_COST))
+):
+    """
+    Get a specific note by ID. Only the note owner can access it.
+    Returns 304 Not Modified when If-None-Match matches the note ETag.
+    """
     note = await NoteService.get_note_by_id(note_id, current_uid)
+    if etag_matches(if_none_match, note.etag):
+        return _not_modified(note.etag)
+
+    response.headers.update(_cache_headers(note.etag))
     return NoteUpdateResponse(
         data=note,
         message="Note retrieved successfully"
     )
 
-# Update a note
+# Update a note, replacing fields or patching its content
 @router.put("/{note_id}", response_model=NoteUpdateResponse)
-async def update_note(note_id: str, note_update: NoteUpdate, current_uid: str = Depends(AuthService.get_current_user_uid)):
-    """Update the note with the specified ID. Only the note owner can update it."""
-    updated_note = await NoteService.update_note(note_id, note_update, current_uid)
+@router.patch("/{note_id}", response_model=NoteUpdateResponse)
+async def update_note(
+    note_id: str,
+    note_update: NoteUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    flush: bool = Query(False, description="With write-behind enabled, write the note before responding, e.g. for an explicit save"),
+    current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))
+):
+    """
+    Update the note with the specified ID. Only the note owner can update it.
+    With If-Match or expected_version, returns 409 Conflict and the server copy if the note changed meanwhile.
+    content_patch applies range edits to the stored content instead of uploading it whole.
+    """
+    updated_note = await NoteService.update_note(note_id, note_update, current_uid, if_match, flush)
+    response.headers["ETag"] = updated_note.etag
     return NoteUpdateResponse(
         data=updated_note,
         message="Note updated successfully"
@@ -56,7 +341,7 @@ async def update_note(note_id: str, note_update: NoteUpdate, current_uid: str =
 
 # Delete a note
 @router.delete("/{note_id}", response_model=NoteDeleteResponse)
-async def delete_note(note_id: str, current_uid: str = Depends(AuthService.get_current_user_uid)):
+async def delete_note(note_id: str, current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))):
     """Delete the note with the specified ID. Only the note owner can delete it."""
     await NoteService.delete_note(note_id, current_uid)
     return NoteDeleteResponse(
@@ -66,7 +351,7 @@ async def delete_note(note_id: str, current_uid: str = Depends(AuthService.get_c
 
 # Toggle favorite status of a note
 @router.patch("/{note_id}/favorite", response_model=NoteUpdateResponse)
-async def toggle_favorite(note_id: str, current_uid: str = Depends(AuthService.get_current_user_uid)):
+async def toggle_favorite(note_id: str, current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))):
     """Toggle favorite status of a note. Only the note owner can toggle it."""
     updated_note = await NoteService.toggle_favorite(note_id, current_uid)
     favorite_status = "added to" if updated_note.is_favorite else "removed from"
@@ -74,3 +359,23 @@ async def toggle_favorite(note_id: str, current_uid: str = Depends(AuthService.g
         data=updated_note,
         message=f"Note {favorite_status} favorites successfully"
     )
+
+# Add tags to a note
+@router.post("/{note_id}/tags", response_model=NoteUpdateResponse)
+async def add_tags(note_id: str, tags_update: NoteTagsUpdate, current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))):
+    """Add tags to a note. Only the note owner can tag it."""
+    updated_note = await NoteService.change_tags(note_id, current_uid, add=tags_update.tags)
+    return NoteUpdateResponse(
+        data=updated_note,
+        message="Tags added successfully"
+    )
+
+# Remove a tag from a note
+@router.delete("/{note_id}/tags/{tag}", response_model=NoteUpdateResponse)
+async def remove_tag(note_id: str, tag: str, current_uid: str = Depends(AuthService.rate_limited(WRITE_COST))):
+    """Remove a tag from a note. Only the note owner can untag it."""
+    updated_note = await NoteService.change_tags(note_id, current_uid, remove=[tag.strip().lower()])
+    return NoteUpdateResponse(
+        data=updated_note,
+        message="Tag removed successfully"
+    )
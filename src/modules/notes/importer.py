@@ -0,0 +1,186 @@
+"""
+Parsing of note archives uploaded to the import endpoint.
+
+Uploads are spooled to a temporary file, in memory up to SPOOL_MEMORY_BYTES
+and on disk beyond, then read back one record at a time. Two formats are
+understood:
+
+- NDJSON: one JSON object per line, shaped like NoteCreate. The output of
+  the export endpoint can be imported as is.
+- A zip of Markdown files: one note per `.md`, `.markdown` or `.txt` file.
+  An optional front matter block between `---` lines can set `id`, `title`,
+  `tags` and `favorite`. The title otherwise comes from the first `# `
+  heading or the file name, and the ID from the file's path in the archive,
+  so importing the same archive twice yields the same IDs.
+"""
+import hashlib
+import tempfile
+import zipfile
+import zlib
+from pathlib import PurePosixPath
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import orjson
+from src.core.error_handling import PayloadTooLargeError, ValidationError
+
+SPOOL_MEMORY_BYTES = 1024 * 1024
+MARKDOWN_SUFFIXES = {".md", ".markdown", ".txt"}
+MAX_MARKDOWN_FILE_BYTES = 16 * 1024 * 1024
+MAX_TITLE_LENGTH = 100
+TRUE_VALUES = {"true", "yes", "1"}
+
+# Where a record came from ("line 12", "notes/todo.md") and the record, or why it could not be read
+ImportRecord = Tuple[str, Any]
+
+
+class RecordError(Exception):
+    """A record of the upload that could not be read."""
+
+
+async def spool_upload(chunks: AsyncIterator[bytes], content_encoding: Optional[str], max_bytes: int) -> tempfile.SpooledTemporaryFile:
+    """
+    Copy the request body to a temporary file, decompressing it if it was
+    sent with `Content-Encoding: gzip`. The limit applies to the
+    decompressed size.
+    """
+    decompressor = None
+    if content_encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=31)
+    elif content_encoding not in (None, "", "identity"):
+        raise ValidationError("Unsupported Content-Encoding", {"content_encoding": content_encoding})
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    size = 0
+    try:
+        async for chunk in chunks:
+            if decompressor is not None:
+                # Bound each step, so a small compressed body cannot expand without limit
+                chunk = decompressor.decompress(chunk, max_bytes - size + 1)
+                while chunk:
+                    size = _spool_chunk(spool, chunk, size, max_bytes)
+                    chunk = decompressor.decompress(decompressor.unconsumed_tail, max_bytes - size + 1)
+            else:
+                size = _spool_chunk(spool, chunk, size, max_bytes)
+        if decompressor is not None:
+            _spool_chunk(spool, decompressor.flush(), size, max_bytes)
+    except zlib.error as e:
+        spool.close()
+        raise ValidationError("Upload is not valid gzip data", {"error": str(e)})
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _spool_chunk(spool, chunk: bytes, size: int, max_bytes: int) -> int:
+    size += len(chunk)
+    if size > max_bytes:
+        raise PayloadTooLargeError(f"Uploads are limited to {max_bytes} bytes")
+    spool.write(chunk)
+    return size
+
+
+def iter_ndjson(upload) -> Iterator[ImportRecord]:
+    """Records of an NDJSON upload, one per non-empty line."""
+    for line_number, line in enumerate(upload, start=1):
+        if not line.strip():
+            continue
+        source = f"line {line_number}"
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield source, RecordError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield source, RecordError("Each line must be a JSON object")
+            continue
+        yield source, record
+
+
+def iter_markdown_zip(upload) -> Iterator[ImportRecord]:
+    """Records of a zip of Markdown files, in archive order. Other files are ignored."""
+    try:
+        archive = zipfile.ZipFile(upload)
+    except zipfile.BadZipFile as e:
+        yield "archive", RecordError(f"Invalid zip archive: {e}")
+        return
+
+    with archive:
+        for info in archive.infolist():
+            path = PurePosixPath(info.filename)
+            if info.is_dir() or path.suffix.lower() not in MARKDOWN_SUFFIXES:
+                continue
+            if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+                continue
+            if info.file_size > MAX_MARKDOWN_FILE_BYTES:
+                yield info.filename, RecordError(f"Files are limited to {MAX_MARKDOWN_FILE_BYTES} bytes")
+                continue
+            try:
+                with archive.open(info) as member:
+                    # The declared size can lie; never read past the limit
+                    raw = member.read(MAX_MARKDOWN_FILE_BYTES + 1)
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError, zlib.error) as e:
+                yield info.filename, RecordError(f"Could not read file: {e}")
+                continue
+            if len(raw) > MAX_MARKDOWN_FILE_BYTES:
+                yield info.filename, RecordError(f"Files are limited to {MAX_MARKDOWN_FILE_BYTES} bytes")
+                continue
+            try:
+                text = raw.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                yield info.filename, RecordError("File is not UTF-8 text")
+                continue
+            yield info.filename, parse_markdown(info.filename, text)
+
+
+def parse_markdown(path: str, text: str) -> Dict[str, Any]:
+    """Note fields of a Markdown file, from its front matter, first heading and path."""
+    meta, body = _split_front_matter(text)
+    record: Dict[str, Any] = {
+        "id": meta.get("id") or "md-" + hashlib.sha256(path.encode("utf-8")).hexdigest()[:32],
+        "title": (meta.get("title") or _first_heading(body) or PurePosixPath(path).stem)[:MAX_TITLE_LENGTH],
+        "content": body.strip("\n")
+    }
+    if meta.get("tags"):
+        record["tags"] = [tag.strip().strip("'\"") for tag in meta["tags"].strip("[]").split(",") if tag.strip().strip("'\"")]
+    favorite = meta.get("favorite") or meta.get("is_favorite")
+    if favorite:
+        record["is_favorite"] = favorite.lower() in TRUE_VALUES
+    return record
+
+
+def _split_front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    lines = text.split("\n")
+    if not lines or lines[0].strip() != "---":
+        return {}, text
+    for end, line in enumerate(lines[1:], start=1):
+        if line.strip() == "---":
+            break
+    else:
+        return {}, text
+
+    meta = {}
+    for line in lines[1:end]:
+        key, separator, value = line.partition(":")
+        if separator:
+            meta[key.strip().lower()] = value.strip().strip("'\"")
+    return meta, "\n".join(lines[end + 1:])
+
+
+def _first_heading(body: str) -> Optional[str]:
+    for line in body.split("\n"):
+        if line.startswith("# "):
+            return line[2:].strip() or None
+        if line.strip():
+            return None
+    return None
+
+
+def take(records: Iterator[ImportRecord], count: int) -> List[ImportRecord]:
+    """The next `count` records, fewer at the end of the upload."""
+    block = []
+    for record in records:
+        block.append(record)
+        if len(block) == count:
+            break
+    return block
@@ -1,7 +1,23 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Any, Dict, Literal, Optional
 from datetime import datetime
 
+MAX_TAGS_PER_NOTE = 20
+MAX_TAG_LENGTH = 50
+MAX_CONTENT_EDITS = 1000
+
+
+def normalize_tags(tags: list[str]) -> list[str]:
+    """Trim and lower-case tags and drop duplicates, keeping their order."""
+    normalized = []
+    for tag in tags:
+        tag = tag.strip().lower()
+        if not tag or len(tag) > MAX_TAG_LENGTH:
+            raise ValueError(f"Tags must be between 1 and {MAX_TAG_LENGTH} characters")
+        if tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
 
 class NoteBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=100)
@@ -11,12 +27,70 @@ class NoteBase(BaseModel):
 
 class NoteCreate(NoteBase):
     id: str = Field(..., min_length=1, description="Note ID provided by client")
+    tags: list[str] = Field(default_factory=list, max_length=MAX_TAGS_PER_NOTE, description="List of tags for the note")
+
+    @field_validator("tags")
+    @classmethod
+    def validate_tags(cls, tags: list[str]) -> list[str]:
+        return normalize_tags(tags)
+
+
+class ContentEdit(BaseModel):
+    start: int = Field(..., ge=0, description="Start of the replaced range in the base content, in code points")
+    end: int = Field(..., ge=0, description="End of the replaced range (exclusive)")
+    text: str = Field("", description="Text inserted in place of the range")
+
+    @model_validator(mode="after")
+    def validate_range(self) -> "ContentEdit":
+        if self.end < self.start:
+            raise ValueError("end must not be before start")
+        return self
 
 
 class NoteUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=1, max_length=100)
     content: Optional[str] = None
     is_favorite: Optional[bool] = Field(None, description="Whether the note is marked as favorite")
+    expected_version: Optional[int] = Field(None, ge=0, description="Only apply the update if the note is still at this version")
+    content_patch: Optional[list[ContentEdit]] = Field(
+        None,
+        min_length=1,
+        max_length=MAX_CONTENT_EDITS,
+        description="Edits to apply to the stored content instead of replacing it; offsets refer to the base content"
+    )
+    base_content_hash: Optional[str] = Field(None, description="SHA-256 hex digest of the content the patch was made against")
+
+    @model_validator(mode="after")
+    def validate_content_change(self) -> "NoteUpdate":
+        if self.content is not None and self.content_patch is not None:
+            raise ValueError("content and content_patch cannot be combined")
+        return self
+
+
+class NoteTagsUpdate(BaseModel):
+    tags: list[str] = Field(..., min_length=1, max_length=MAX_TAGS_PER_NOTE, description="Tags to add to the note")
+
+    @field_validator("tags")
+    @classmethod
+    def validate_tags(cls, tags: list[str]) -> list[str]:
+        return normalize_tags(tags)
+
+
+class NoteFilters(BaseModel):
+    """Filters and ordering of a notes listing."""
+    tag: Optional[str] = None
+    favorite: Optional[bool] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    sort: Literal["updated_at", "created_at", "title"] = "updated_at"
+    order: Optional[Literal["asc", "desc"]] = None
+
+    @property
+    def direction(self) -> Literal["asc", "desc"]:
+        """Requested order, defaulting to newest first for dates and A-Z for titles."""
+        if self.order is not None:
+            return self.order
+        return "asc" if self.sort == "title" else "desc"
 
 
 class NoteInDB(NoteBase):
@@ -25,3 +99,13 @@ class NoteInDB(NoteBase):
     tags: list[str] = Field(default_factory=list, description="List of tags for the note")
     created_at: datetime
     updated_at: datetime
+
+
+class NoteBatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: str = Field(..., min_length=1, description="ID of the note the operation applies to")
+    data: Optional[Dict[str, Any]] = Field(None, description="Note fields for create, changed fields for update")
+
+
+class NoteBatchRequest(BaseModel):
+    operations: list[NoteBatchOperation] = Field(..., min_length=1, max_length=1000)
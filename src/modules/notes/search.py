@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+TITLE_BOOST = 3.0  # A title occurrence counts like three content occurrences
+PREFIX_WEIGHT = 0.5  # Prefix expansions score lower than exact term matches
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-cased word tokens."""
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class UserIndex:
+    """
+    Inverted index over the title and content of one user's notes.
+
+    Each note is stored as a term-frequency vector over its title and content,
+    with title terms boosted, and ranked with BM25. `watermark` is the last
+    Firestore change folded in by a catch-up sync.
+    """
+
+    def __init__(self):
+        self.notes: Dict[str, Dict[str, float]] = {}  # note ID -> term frequencies
+        self.postings: Dict[str, Dict[str, float]] = {}  # term -> note ID -> frequency
+        self.lengths: Dict[str, float] = {}
+        self.watermark: Optional[str] = None
+        self.synced_at = 0.0  # monotonic time of the last catch-up sync
+        self._sorted_terms: Optional[List[str]] = None
+
+    def add(self, note_id: str, title: str, content: str) -> None:
+        """Index a note, replacing its previous version."""
+        frequencies: Dict[str, float] = Counter(tokenize(content))
+        for term in tokenize(title):
+            frequencies[term] += TITLE_BOOST
+        self._add_frequencies(note_id, dict(frequencies))
+
+    def _add_frequencies(self, note_id: str, frequencies: Dict[str, float]) -> None:
+        self.remove(note_id)
+        for term, frequency in frequencies.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._sorted_terms = None
+            self.postings[term][note_id] = frequency
+        self.notes[note_id] = frequencies
+        self.lengths[note_id] = sum(frequencies.values())
+
+    def remove(self, note_id: str) -> None:
+        frequencies = self.notes.pop(note_id, None)
+        if frequencies is None:
+            return
+        del self.lengths[note_id]
+        for term in frequencies:
+            del self.postings[term][note_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self._sorted_terms = None
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Index terms matching a query token, exactly or by prefix, with their weight."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        expansions = []
+        for position in range(bisect.bisect_left(self._sorted_terms, token), len(self._sorted_terms)):
+            term = self._sorted_terms[position]
+            if not term.startswith(token):
+                break
+            expansions.append((term, 1.0 if term == token else PREFIX_WEIGHT))
+        return expansions
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """Rank the notes matching every query token, best first."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.notes:
+            return []
+
+        note_count = len(self.notes)
+        average_length = sum(self.lengths.values()) / note_count or 1.0
+        scores: Optional[Dict[str, float]] = None
+        for token in tokens:
+            token_scores: Dict[str, float] = {}
+            for term, weight in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (note_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for note_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[note_id] / average_length)
+                    score = weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    # A token scores through its best matching term only
+                    token_scores[note_id] = max(token_scores.get(note_id, 0.0), score)
+
+            # Every token has to match
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {note_id: score + token_scores[note_id] for note_id, score in scores.items() if note_id in token_scores}
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def to_snapshot(self) -> dict:
+        return {"watermark": self.watermark, "notes": self.notes}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "UserIndex":
+        index = cls()
+        index.watermark = snapshot.get("watermark")
+        for note_id, frequencies in snapshot.get("notes", {}).items():
+            index._add_frequencies(note_id, frequencies)
+        return index
+
+
+# Loads the changes after a watermark: (changed notes, deleted note IDs, new watermark)
+ChangesLoader = Callable[[str, Optional[str]], Awaitable[Tuple[List[dict], List[str], Optional[str]]]]
+
+
+class SearchIndex:
+    """
+    In-process search indexes of the most recently searched users.
+
+    Firestore stays the source of truth. An index is built on a user's first
+    search, from the persisted snapshot plus the changes made since it, and is
+    then kept current incrementally by the note writes of this process. Writes
+    made by other processes are picked up by a delta sync at most every
+    `sync_interval` seconds. Indexes evicted from memory or still loaded at
+    shutdown are saved as snapshots.
+    """
+
+    def __init__(self, snapshot_dir: str, max_users: int, sync_interval: float):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.max_users = max_users
+        self.sync_interval = sync_interval
+        self._indexes: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _snapshot_path(self, current_uid: str) -> Path:
+        return self.snapshot_dir / f"{current_uid}.json"
+
+    def _read_snapshot(self, current_uid: str) -> Optional[UserIndex]:
+        try:
+            with open(self._snapshot_path(current_uid), "r", encoding="utf-8") as snapshot_file:
+                return UserIndex.from_snapshot(json.load(snapshot_file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable search snapshot of user %s. Error: %s", current_uid, e)
+            return None
+
+    def _write_snapshot(self, current_uid: str, index: UserIndex) -> None:
+        try:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            path = self._snapshot_path(current_uid)
+            # Each writer gets its own temporary file, so workers saving the same user never interleave
+            snapshot_file = tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.snapshot_dir, prefix=f"{path.stem}.", suffix=".tmp", delete=False
+            )
+            try:
+                with snapshot_file:
+                    json.dump(index.to_snapshot(), snapshot_file, separators=(",", ":"))
+                os.replace(snapshot_file.name, path)
+            except BaseException:
+                # Leave no partial snapshot behind
+                Path(snapshot_file.name).unlink(missing_ok=True)
+                raise
+        except OSError as e:
+            logging.warning("Failed to save search snapshot of user %s. Error: %s", current_uid, e)
+
+    async def get(self, current_uid: str, load_changes: ChangesLoader) -> UserIndex:
+        """Return the user's index, loading or catching it up with Firestore when needed."""
+        lock = self._locks.setdefault(current_uid, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(current_uid)
+            if index is None:
+                index = await asyncio.to_thread(self._read_snapshot, current_uid) or UserIndex()
+                await self._catch_up(current_uid, index, load_changes)
+                self._indexes[current_uid] = index
+                await self._evict()
+            elif time.monotonic() - index.synced_at >= self.sync_interval:
+                await self._catch_up(current_uid, index, load_changes)
+
+            self._indexes.move_to_end(current_uid)
+            return index
+
+    async def _catch_up(self, current_uid: str, index: UserIndex, load_changes: ChangesLoader) -> None:
+        notes, deleted_ids, watermark = await load_changes(current_uid, index.watermark)
+        for note in notes:
+            index.add(note["id"], note["title"], note["content"])
+        for note_id in deleted_ids:
+            index.remove(note_id)
+        index.watermark = watermark
+        index.synced_at = time.monotonic()
+
+    async def _evict(self) -> None:
+        while len(self._indexes) > self.max_users:
+            current_uid, index = self._indexes.popitem(last=False)
+            self._locks.pop(current_uid, None)
+            await asyncio.to_thread(self._write_snapshot, current_uid, index)
+
+    def note_written(self, current_uid: str, note_id: str, title: str, content: str) -> None:
+        """Apply a note write to the user's index if it is loaded."""
+        index = self._indexes.get(current_uid)
+        if index is not None:
+            index.add(note_id, title, content)
+
+    def note_deleted(self, current_uid: str, note_id: str) -> None:
+        """Apply a note deletion to the user's index if it is loaded."""
+        index = self._indexes.get(current_uid)
+        if index is not None:
+            index.remove(note_id)
+
+    def stats(self) -> dict:
+        return {
+            "indexed_users": len(self._indexes),
+            "max_users": self.max_users,
+            "indexed_notes": sum(len(index.notes) for index in self._indexes.values())
+        }
+
+    def save_all(self) -> None:
+        """Persist a snapshot of every loaded index."""
+        for current_uid, index in self._indexes.items():
+            self._write_snapshot(current_uid, index)
@@ -1,237 +1,1472 @@
-from datetime import datetime
-from typing import List
-from firebase_admin.firestore import SERVER_TIMESTAMP
-from src.core.firebase import db
-from src.modules.notes.models import NoteCreate, NoteUpdate, NoteInDB
-from src.core.response import NoteResponse
-from src.core.error_handling import NotFoundError, ForbiddenError, ValidationError, InternalServerError
+import asyncio
+import base64
+import hashlib
+import json
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from firebase_admin.firestore import SERVER_TIMESTAMP, DELETE_FIELD, Query, FieldFilter, Increment
+from src.core.firebase import db, async_db
+from src.core.cache import create_cache
+from src.core.config import settings
+from src.core.metrics import instrument_service
+from src.core.single_flight import SingleFlight
+from google.api_core import exceptions as google_exceptions
+from pydantic import ValidationError as PydanticValidationError
+from src.modules.notes.models import NoteCreate, NoteUpdate, NoteInDB, NoteBatchOperation, NoteFilters, MAX_TAGS_PER_NOTE
+from src.modules.notes.search import SearchIndex
+from src.modules.notes.stream import NoteChangeFeed, event_id
+from src.modules.notes.importer import ImportRecord, RecordError, take
+from src.modules.notes.write_behind import PendingNote, WriteBehindBuffer
+from src.modules.notes.storage import CONTENT_STORAGE_FIELDS, encode_content, decode_content, materialize, is_stored_large, chunk_count
+from src.core.response import (
+    NoteResponse,
+    NotesPage,
+    NoteChangesPage,
+    NoteSearchPage,
+    NoteBatchItemResult,
+    serialize_note,
+    NOTE_FIELD_DEFAULTS,
+    note_etag,
+    etag_matches,
+    collection_etag
+)
+from src.core.error_handling import NotFoundError, ForbiddenError, ValidationError, ConflictError, InternalServerError
 import logging
 
 NOTES_COLLECTION = "notes"
 USER_NOTES_SUBCOLLECTION = "userNotes"
+DELETED_NOTES_SUBCOLLECTION = "deletedNotes"
+SUMMARIES_SUBCOLLECTION = "summaries"
+TAG_COUNTS_DOCUMENT = "tags"
+CONTENT_CHUNKS_SUBCOLLECTION = "contentChunks"
+MAX_PAGE_SIZE = 500
+EXPORT_PAGE_SIZE = 200
+MAX_BATCH_WRITES = 500  # Firestore limit of writes per WriteBatch
+MAX_BATCH_BYTES = 8 * 1024 * 1024  # Content bytes per WriteBatch, below Firestore's 10 MiB request limit
+MAX_WRITE_ATTEMPTS = 5  # Attempts of conditional read-modify-write operations
+MAX_SEARCH_PAGE_SIZE = 100
+IMPORT_READ_SIZE = 500  # Import records validated and checked for existence together
+NOTE_FIELDS = tuple(NoteResponse.model_fields)
+# Stored fields read by listings: everything but the compressed content of large notes
+LIST_FIELDS = sorted(set(NOTE_FIELDS) - {"id", "content_truncated"} | set(CONTENT_STORAGE_FIELDS) - {"content_zlib", "content_chunks"})
 
+
+# Read-through cache of note reads. Entries are namespaced by a per-user
+# generation that every write replaces, which invalidates all of the user's
+# cached lists and notes at once.
+note_cache = create_cache()
+
+
+async def _cache_prefix(current_uid: str) -> str:
+    generation_key = f"notes:{current_uid}:generation"
+    generation = await note_cache.get(generation_key, record=False)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        await note_cache.set(generation_key, generation)
+    return f"notes:{current_uid}:{generation}"
+
+
+async def _list_cache_key(
+    current_uid: str,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: Optional[List[str]],
+    filters: NoteFilters,
+    include_content: bool = False
+) -> str:
+    return f"{await _cache_prefix(current_uid)}:{_list_key(limit, cursor, fields, filters, include_content)}"
+
+
+def _list_key(limit: Optional[int], cursor: Optional[str], fields: Optional[List[str]], filters: NoteFilters, include_content: bool) -> str:
+    projection = ",".join(fields) if fields is not None else "*"
+    return f"list:{limit}:{cursor}:{projection}:{include_content}:{_filters_key(filters)}"
+
+
+def _filters_key(filters: NoteFilters) -> str:
+    return filters.model_dump_json()
+
+
+async def _invalidate_cache(current_uid: str) -> None:
+    note_reads.invalidate(current_uid)
+    await note_cache.delete(f"notes:{current_uid}:generation")
+
+
+# Concurrent identical reads of a user share one Firestore call. Writes detach
+# the reads in flight, so a read that starts after a write sees that write.
+note_reads = SingleFlight()
+
+
+# Full-text indexes of the recently searched users, kept current by the writes below
+search_index = SearchIndex(
+    settings.SEARCH_INDEX_DIR,
+    settings.SEARCH_MAX_INDEXED_USERS,
+    settings.SEARCH_SYNC_INTERVAL_SECONDS
+)
+
+
+async def _load_search_changes(current_uid: str, watermark: Optional[str]) -> Tuple[List[dict], List[str], Optional[str]]:
+    """Notes changed and deleted after a search index watermark, read through delta sync."""
+    changes = await NoteService.get_changes(current_uid, datetime.fromisoformat(watermark) if watermark else None)
+    return changes.notes, [tombstone["id"] for tombstone in changes.deleted], changes.watermark
+
+
+# Real-time change events, one shared snapshot listener per connected user
+change_feed = NoteChangeFeed(
+    lambda current_uid: db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION),
+    settings.STREAM_BUFFER_SIZE,
+    settings.STREAM_HEARTBEAT_SECONDS
+)
+
+
+async def _catch_up_events(current_uid: str, since: datetime) -> List[dict]:
+    """Change events for what changed after `since`, read through delta sync, oldest first."""
+    changes = await NoteService.get_changes(current_uid, since)
+    events = []
+    for note in changes.notes:
+        changed_at = datetime.fromisoformat(note["last_synced_at"])
+        event_type = "created" if datetime.fromisoformat(note["created_at"]) > since else "updated"
+        events.append((changed_at, {"id": event_id(changed_at, 0), "event": event_type, "data": note}))
+    for tombstone in changes.deleted:
+        deleted_at = datetime.fromisoformat(tombstone["deleted_at"])
+        events.append((deleted_at, {"id": event_id(deleted_at, 0), "event": "deleted", "data": {"id": tombstone["id"]}}))
+    return [event for _, event in sorted(events, key=lambda item: item[0])]
+
+
+async def _write_pending(pending: PendingNote) -> None:
+    """
+    Write the merged updates of a note in one commit, conditioned on the
+    stored state they were applied to.
+
+    If the note was changed elsewhere meanwhile, such as through another
+    worker, unconditional updates are applied over that change as its next
+    version. Updates made with `expected_version`, If-Match or
+    `base_content_hash` are dropped instead, as they would have been
+    rejected had the change come first; so are the updates of a deleted note.
+    """
+    doc_ref = db.collection(NOTES_COLLECTION).document(pending.current_uid).collection(USER_NOTES_SUBCOLLECTION).document(pending.note_id)
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        write_data = pending.write_data
+        batch = db.batch()
+        chunks = None
+        if "content" in write_data:
+            content_fields, chunks = _stored_content(write_data["content"], update=True)
+            batch.update(doc_ref, {**write_data, **content_fields}, option=db.write_option(last_update_time=pending.base_update_time))
+            _write_chunks(batch, doc_ref, chunks, chunk_count(pending.note_data))
+        else:
+            batch.update(doc_ref, write_data, option=db.write_option(last_update_time=pending.base_update_time))
+        try:
+            await async_db.commit(batch)
+            break
+        except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+            doc = await async_db.get(doc_ref)
+            if not doc.exists:
+                logging.warning("Note %s was deleted with buffered updates, dropping them", pending.note_id)
+                pending.drop(NotFoundError("Note", pending.note_id))
+                return
+            stored = await _load_note(doc)
+            if pending.guarded:
+                logging.warning("Note %s changed under buffered conditional updates, dropping them", pending.note_id)
+                pending.drop(ConflictError("Note was modified by another client", {"server_note": serialize_note(pending.note_id, stored)}))
+                return
+            logging.warning("Note %s changed while it had buffered updates, applying them over the change", pending.note_id)
+            write_data["version"] = _next_version(stored)
+            pending.rebase(_resolve_server_timestamps({**stored, **write_data}, datetime.now(timezone.utc)), doc.update_time)
+    else:
+        raise ConflictError("Note is being modified concurrently. Please try again.")
+
+    note_data = {**pending.note_data, **_resolve_server_timestamps(write_data, batch.commit_time)}
+    pending.note_data = _with_chunk_count(note_data, chunks) if chunks is not None else note_data
+    await _invalidate_cache(pending.current_uid)
+    search_index.note_written(pending.current_uid, pending.note_id, note_data["title"], note_data["content"])
+    logging.info(
+        "Wrote %s buffered updates of note %s as version %s for user: %s",
+        pending.updates, pending.note_id, write_data["version"], pending.current_uid
+    )
+
+
+# Autosave updates merged in memory and written once per window, if enabled
+note_writes = WriteBehindBuffer(
+    _write_pending,
+    settings.WRITE_BEHIND_WINDOW_SECONDS,
+    settings.WRITE_BEHIND_MAX_PENDING_NOTES,
+    settings.WRITE_BEHIND_MAX_PENDING_BYTES
+) if settings.WRITE_BEHIND_ENABLED else None
+
+
+async def _settle_note(current_uid: str, note_id: str) -> None:
+    """Write the buffered updates of a note before another kind of change to it."""
+    if note_writes is not None:
+        await note_writes.flush(current_uid, note_id)
+
+
+async def _settle_writes(current_uid: str) -> None:
+    """Write the buffered updates of the user's notes before a read or write spanning notes."""
+    if note_writes is not None:
+        await note_writes.flush_user(current_uid)
+
+
+def _tombstone_ref(current_uid: str, note_id: str):
+    """Tombstone recording a deleted note: notes/{userId}/deletedNotes/{noteId}."""
+    return db.collection(NOTES_COLLECTION).document(current_uid).collection(DELETED_NOTES_SUBCOLLECTION).document(note_id)
+
+
+def _tag_counts_ref(current_uid: str):
+    """Per-user summary of how many notes carry each tag: notes/{userId}/summaries/tags."""
+    return db.collection(NOTES_COLLECTION).document(current_uid).collection(SUMMARIES_SUBCOLLECTION).document(TAG_COUNTS_DOCUMENT)
+
+
+def _count_tags(batch, current_uid: str, deltas: Dict[str, int]) -> None:
+    """Add the tag count changes to a write batch, in the same commit as the note writes."""
+    deltas = {tag: delta for tag, delta in deltas.items() if delta}
+    if deltas:
+        batch.set(_tag_counts_ref(current_uid), {"counts": {tag: Increment(delta) for tag, delta in deltas.items()}}, merge=True)
+
+
+def _chunk_ref(doc_ref, position: int):
+    """Chunk of a large note's compressed content: notes/{userId}/userNotes/{noteId}/contentChunks/{position}."""
+    return doc_ref.collection(CONTENT_CHUNKS_SUBCOLLECTION).document(f"{position:05d}")
+
+
+def _stored_content(content: str, update: bool = False) -> Tuple[dict, List[bytes]]:
+    """
+    Content fields of the note document and content chunks for new content.
+
+    An update also deletes the fields of the layout the note had before.
+    Content whose chunks would not fit in a single commit is rejected.
+    """
+    fields, chunks = encode_content(content, settings.CONTENT_COMPRESSION_THRESHOLD_BYTES, settings.CONTENT_INLINE_MAX_BYTES)
+    # The note and all of its chunks are written in one commit
+    if sum(len(chunk) for chunk in chunks) > MAX_BATCH_BYTES:
+        raise ValidationError("Note content is too large", {"max_compressed_bytes": MAX_BATCH_BYTES})
+    if update:
+        fields.update({field: DELETE_FIELD for field in CONTENT_STORAGE_FIELDS if field not in fields})
+    return fields, chunks
+
+
+def _content_writes(chunks: List[bytes], previous_chunks: int) -> int:
+    """Number of chunk writes, including deletes of the chunks the new content no longer uses."""
+    return len(chunks) + max(previous_chunks - len(chunks), 0)
+
+
+def _write_chunks(batch, doc_ref, chunks: List[bytes], previous_chunks: int = 0) -> None:
+    for position, chunk in enumerate(chunks):
+        batch.set(_chunk_ref(doc_ref, position), {"data": chunk})
+    for position in range(len(chunks), previous_chunks):
+        batch.delete(_chunk_ref(doc_ref, position))
+
+
+def _content_bytes(fields: dict, chunks: List[bytes]) -> int:
+    """Approximate request size of stored content, used to keep batches below Firestore's limit."""
+    inline = [fields.get("content"), fields.get("content_zlib")]  # Either may be a DELETE_FIELD sentinel
+    return sum(len(value) for value in inline if isinstance(value, (str, bytes))) + sum(len(chunk) for chunk in chunks)
+
+
+def _with_chunk_count(note_data: dict, chunks: List[bytes]) -> dict:
+    """Note after a content write, with the chunk count the next write has to clean up."""
+    note_data = {field: value for field, value in note_data.items() if field != "content_chunks"}
+    if chunks:
+        note_data["content_chunks"] = len(chunks)
+    return note_data
+
+
+async def _load_note(doc) -> dict:
+    """
+    The data of a note snapshot with its content reassembled.
+
+    Inline content is decompressed in place; chunked content costs one more
+    read, of the chunk documents.
+    """
+    note_data = doc.to_dict()
+    if not is_stored_large(note_data):
+        return note_data
+    chunks = None
+    if chunk_count(note_data):
+        chunk_docs = await async_db.stream(doc.reference.collection(CONTENT_CHUNKS_SUBCOLLECTION).order_by("__name__"))
+        chunks = [chunk_doc.get("data") for chunk_doc in chunk_docs]
+    return materialize(note_data, decode_content(note_data, chunks))
+
+
+def _new_note_data(note: NoteCreate, current_uid: str) -> dict:
+    """Build the document stored for a new note."""
+    note_data = note.dict()
+    note_data.pop("id")  # The ID is the document ID, not a field
+    note_data.update({
+        "owner_uid": current_uid,
+        "created_at": SERVER_TIMESTAMP,
+        "updated_at": SERVER_TIMESTAMP,
+        "sync_status": "synced",
+        "version": 1,
+        "last_synced_at": SERVER_TIMESTAMP
+    })
+    return note_data
+
+
+def _update_data(note_update: NoteUpdate) -> dict:
+    """
+    Build the field updates applied to a note.
+
+    The caller adds the version bump and, for a content patch, the patched
+    content, since both depend on the stored note.
+    """
+    update_data = note_update.dict(exclude_unset=True, exclude={"expected_version", "content_patch", "base_content_hash"})
+    if not update_data and note_update.content_patch is None:
+        raise ValidationError("No fields to update")
+
+    # Only update updated_at if content-related fields are being updated
+    if "title" in update_data or "content" in update_data or note_update.content_patch is not None:
+        update_data["updated_at"] = SERVER_TIMESTAMP
+    # Every accepted change moves the note past the clients' sync watermark
+    update_data["last_synced_at"] = SERVER_TIMESTAMP
+    return update_data
+
+
+def _next_version(note_data: dict) -> int:
+    """Version written by the next change of a note; it is conditioned on the read it is computed from."""
+    return note_data.get("version", 0) + 1
+
+
+def _check_expected_version(
+    note_id: str,
+    note_data: dict,
+    expected_version: Optional[int],
+    if_match: Optional[str] = None
+) -> None:
+    """Raise a ConflictError carrying the server copy if the note is not in the state the client expects."""
+    server_note = serialize_note(note_id, note_data)
+    version_conflict = expected_version is not None and server_note["version"] != expected_version
+    etag_conflict = if_match is not None and not etag_matches(if_match, note_etag(note_id, server_note["created_at"], server_note["version"]))
+    if version_conflict or etag_conflict:
+        raise ConflictError("Note was modified by another client", {"server_note": server_note})
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _patched_content(note_id: str, note_data: dict, note_update: NoteUpdate, if_match: Optional[str] = None) -> dict:
+    """
+    Apply the content patch of an update to the stored content.
+
+    Edit offsets refer to the content the client based the patch on, so a
+    patch needs a guard proving that this is still the stored content: the
+    expected version, an If-Match ETag (both checked by the caller) or the
+    hash of the base content.
+    """
+    if note_update.content_patch is None:
+        return {}
+    if note_update.expected_version is None and if_match is None and note_update.base_content_hash is None:
+        raise ValidationError("content_patch requires expected_version, If-Match or base_content_hash")
+
+    content = note_data["content"]
+    if note_update.base_content_hash is not None and note_update.base_content_hash.lower() != _content_hash(content):
+        raise ConflictError("Note content was modified by another client", {"server_note": serialize_note(note_id, note_data)})
+
+    # Splice from the last edit backwards so earlier offsets stay valid
+    edits = sorted(note_update.content_patch, key=lambda edit: edit.start)
+    parts = []
+    position = len(content)
+    for edit in reversed(edits):
+        if edit.end > position:
+            raise ValidationError("content_patch edits overlap or go past the end of the content")
+        parts.append(content[edit.end:position])
+        parts.append(edit.text)
+        position = edit.start
+    parts.append(content[:position])
+    patched = "".join(reversed(parts))
+
+    if not patched:
+        raise ValidationError("Note content cannot be empty")
+    return {"content": patched}
+
+
+def _resolve_server_timestamps(note_data: dict, commit_time: datetime) -> dict:
+    """Replace SERVER_TIMESTAMP sentinels with the commit time they resolved to."""
+    return {
+        field: commit_time if value is SERVER_TIMESTAMP else value
+        for field, value in note_data.items()
+    }
+
+
+def _batch_error(
+    operation: NoteBatchOperation,
+    status_code: int,
+    error_message: str,
+    details: Optional[Dict[str, Any]] = None
+) -> NoteBatchItemResult:
+    return NoteBatchItemResult(
+        id=operation.id,
+        op=operation.op,
+        success=False,
+        statusCode=status_code,
+        errorMessage=error_message,
+        details=details
+    )
+
+
+def _validation_details(e: PydanticValidationError) -> Dict[str, Any]:
+    return {
+        "validation_errors": [
+            {"field": " -> ".join(str(loc) for loc in error["loc"]), "message": error["msg"], "type": error["type"]}
+            for error in e.errors()
+        ]
+    }
+
+
+def _import_error(source: str, note_id: Optional[str], status_code: int, error_message: str, details: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {"type": "error", "source": source, "id": note_id, "statusCode": status_code, "errorMessage": error_message, "details": details}
+
+
+def _encode_cursor(doc, filters: NoteFilters) -> str:
+    """Build an opaque page cursor from the last note of a page and the sort it was listed by."""
+    value = doc.get(filters.sort)
+    payload = {
+        "sort": filters.sort,
+        "order": filters.direction,
+        "value": value.isoformat() if isinstance(value, datetime) else value,
+        "id": doc.id
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _decode_cursor(cursor: str, filters: NoteFilters) -> Dict[str, Any]:
+    """Turn a page cursor back into `start_after` values for the notes query."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        sort_matches = payload["sort"] == filters.sort and payload["order"] == filters.direction
+    except (ValueError, KeyError, TypeError):
+        raise ValidationError("Invalid cursor")
+    if not sort_matches:
+        raise ValidationError("Cursor does not match the requested sort order")
+
+    try:
+        value = payload["value"]
+        if filters.sort != "title":
+            value = datetime.fromisoformat(value)
+        return {filters.sort: value, "__name__": payload["id"]}
+    except (ValueError, KeyError, TypeError):
+        raise ValidationError("Invalid cursor")
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes from query parameters as UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _notes_query(current_uid: str, filters: NoteFilters):
+    """
+    Build the notes query for a listing, with every filter pushed down to Firestore.
+
+    Equality and array filters combined with a sort need the composite indexes
+    declared in firestore.indexes.json.
+    """
+    query = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
+    if filters.tag is not None:
+        query = query.where(filter=FieldFilter("tags", "array_contains", filters.tag))
+    if filters.favorite is not None:
+        query = query.where(filter=FieldFilter("is_favorite", "==", filters.favorite))
+    if filters.updated_after is not None or filters.updated_before is not None:
+        # A range filter has to be on the first sort field
+        if filters.sort != "updated_at":
+            raise ValidationError("updated_after and updated_before can only be used with sort=updated_at")
+        if filters.updated_after is not None:
+            query = query.where(filter=FieldFilter("updated_at", ">", _as_utc(filters.updated_after)))
+        if filters.updated_before is not None:
+            query = query.where(filter=FieldFilter("updated_at", "<", _as_utc(filters.updated_before)))
+
+    # Note ID breaks ties, so cursors stay stable among equal sort values
+    direction = Query.ASCENDING if filters.direction == "asc" else Query.DESCENDING
+    return query.order_by(filters.sort, direction=direction).order_by("__name__", direction=direction)
+
+
+
+def _to_note_response(note_id: str, note_data: dict) -> NoteResponse:
+    """Build the API representation of a stored note without re-validating it."""
+    return NoteResponse.model_construct(**serialize_note(note_id, note_data))
+
+
+def _project_note(note_id: str, note_data: dict, fields: List[str]) -> Dict[str, Any]:
+    """Keep only the requested fields of a note, serialized like NoteResponse."""
+    projected = {}
+    for field in fields:
+        if field == "id":
+            value = note_id
+        elif field == "content":
+            value = note_data.get("content", note_data.get("content_preview"))
+        elif field == "content_truncated":
+            value = is_stored_large(note_data)
+        else:
+            value = note_data.get(field, NOTE_FIELD_DEFAULTS.get(field))
+        projected[field] = value.isoformat() if isinstance(value, datetime) else value
+    return projected
+
+
+class _BatchChunk:
+    """Operations of one batch request that are committed together."""
+
+    def __init__(self, current_uid: str, state: dict, update_times: dict):
+        self.current_uid = current_uid
+        self.state = state  # Stored data of each note, updated on commit
+        self.update_times = update_times  # Last known update time of each note, advanced on commit
+        self.batch = db.batch()
+        self.note_ids = set()
+        self.pending = []
+        self.tag_deltas = Counter()  # Written to the tag summary once, at commit
+        self.content_bytes = 0
+
+    def add(self, index: int, operation: NoteBatchOperation, note_data: Optional[dict]) -> None:
+        self.note_ids.add(operation.id)
+        self.pending.append((index, operation, note_data))
+
+    async def commit(self, results: list) -> None:
+        """Commit the chunk and record the result of each of its operations."""
+        if not self.pending:
+            return
+        _count_tags(self.batch, self.current_uid, self.tag_deltas)
+        try:
+            await async_db.commit(self.batch)
+        except (google_exceptions.Conflict, google_exceptions.NotFound, google_exceptions.FailedPrecondition) as e:
+            logging.warning("Batch chunk rejected by a concurrent change. Error: %s", e)
+            for index, operation, _ in self.pending:
+                results[index] = _batch_error(operation, 409, "Note was modified concurrently. Please retry.")
+            return
+
+        for index, operation, note_data in self.pending:
+            if note_data is not None:
+                note_data = _resolve_server_timestamps(note_data, self.batch.commit_time)
+            self.state[operation.id] = note_data
+            # Every write of a commit shares its commit time as update time
+            self.update_times[operation.id] = self.batch.commit_time
+            results[index] = NoteBatchItemResult(
+                id=operation.id,
+                op=operation.op,
+                success=True,
+                statusCode=200 if operation.op != "create" else 201,
+                data=_to_note_response(operation.id, note_data) if note_data is not None else None
+            )
+
+
+@instrument_service
 class NoteService:
     @staticmethod
     async def create_note(note: NoteCreate, current_uid: str) -> NoteResponse:
         """Create a new note."""
         try:
-            note_data = note.dict()
-            note_id = note_data.pop("id")  # Extract ID from request data
-            note_data.update({
-                "owner_uid": current_uid,
-                "tags": [],  # Automatically add empty tags list
-                "created_at": SERVER_TIMESTAMP,
-                "updated_at": SERVER_TIMESTAMP,
-                "sync_status": "synced",
-                "last_synced_at": SERVER_TIMESTAMP     
-            })
+            note_id = note.id
+            note_data = _new_note_data(note, current_uid)
 
             # Create note in nested collection with client-provided ID: notes/{userId}/userNotes/{noteId}
             user_notes_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
             doc_ref = user_notes_ref.document(note_id)
             
-            # Check if note with this ID already exists
-            if doc_ref.get().exists:
-                logging.warning(f"Note with ID {note_id} already exists for user {current_uid}")
+            # Large content is stored compressed, in chunk documents when it does not fit in the note
+            content_fields, chunks = _stored_content(note_data["content"])
+            stored_data = {field: value for field, value in note_data.items() if field != "content"}
+            stored_data.update(content_fields)
+
+            # Write the note and clear the tombstone of an earlier note with the same ID.
+            # create() only succeeds if the note does not exist yet, so no prior read is needed.
+            batch = db.batch()
+            batch.create(doc_ref, stored_data)
+            batch.delete(_tombstone_ref(current_uid, note_id))
+            _write_chunks(batch, doc_ref, chunks)
+            _count_tags(batch, current_uid, {tag: 1 for tag in note_data["tags"]})
+            try:
+                await async_db.commit(batch)
+            except google_exceptions.AlreadyExists:
+                logging.warning("Note with ID %s already exists for user %s", note_id, current_uid)
                 raise ValidationError("Note with this ID already exists")
             
-            doc_ref.set(note_data)
-            created_note = doc_ref.get().to_dict()
+            await _invalidate_cache(current_uid)
+            search_index.note_written(current_uid, note_id, note_data["title"], note_data["content"])
+            note_response = _to_note_response(note_id, _resolve_server_timestamps(note_data, batch.commit_time))
             
-            note_response = NoteResponse(
-                id=note_id,
-                title=created_note["title"],
-                content=created_note["content"],
-                owner_uid=created_note["owner_uid"],
-                is_favorite=created_note["is_favorite"],
-                tags=created_note["tags"],
-                sync_status=created_note["sync_status"],
-                last_synced_at=created_note["last_synced_at"].isoformat(),
-                created_at=created_note["created_at"].isoformat(),
-                updated_at=created_note["updated_at"].isoformat()
-            )
-            
-            logging.info(f"Created new note {note_id} for user: {current_uid}")
+            logging.info("Created new note %s for user: %s", note_id, current_uid)
             return note_response
         except ValidationError:
             raise
         except Exception as e:
-            logging.error(f"Failed to create note for user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to create note for user %s. Error: %s", current_uid, e)
             raise InternalServerError("Failed to create note. Please try again.")
 
     @staticmethod
-    async def get_user_notes(current_uid: str) -> List[NoteResponse]:
-        """Get all notes for the logged in user."""
+    async def apply_batch(operations: List[NoteBatchOperation], current_uid: str) -> List[NoteBatchItemResult]:
+        """
+        Apply a list of create/update/delete operations with batched writes.
+
+        The current state of every affected note is read in one round-trip and
+        each operation is validated against it in order. The resulting writes are
+        committed in WriteBatch chunks of at most MAX_BATCH_WRITES writes, so a
+        typical sync needs two round-trips. Every operation gets its own result
+        and an invalid item does not stop the others. Creates are conditioned on
+        the note not existing, and updates and deletes on the update time of the
+        state they were validated against, so a concurrent change fails the
+        chunk it lands in instead of being overwritten.
+        """
+        await _settle_writes(current_uid)
         try:
-            notes = []
-            # Query nested collection: notes/{userId}/userNotes
             user_notes_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
-            docs = user_notes_ref.stream()
-            
-            for doc in docs:
-                note_data = doc.to_dict()
-                note_response = NoteResponse(
-                    id=doc.id,
-                    title=note_data["title"],
-                    content=note_data["content"],
-                    owner_uid=note_data["owner_uid"],
-                    is_favorite=note_data["is_favorite"],
-                    tags=note_data["tags"],
-                    sync_status=note_data["sync_status"],
-                    last_synced_at=note_data["last_synced_at"].isoformat(),
-                    created_at=note_data["created_at"].isoformat(),
-                    updated_at=note_data["updated_at"].isoformat()
-                )
-                notes.append(note_response)
+            note_ids = list(dict.fromkeys(operation.id for operation in operations))
+            snapshots = await async_db.get_all([user_notes_ref.document(note_id) for note_id in note_ids])
+            loaded = await asyncio.gather(*(_load_note(doc) for doc in snapshots if doc.exists))
+            state = {doc.id: None for doc in snapshots}
+            state.update(zip((doc.id for doc in snapshots if doc.exists), loaded))
+            update_times = {doc.id: doc.update_time for doc in snapshots if doc.exists}
+
+            results: List[Optional[NoteBatchItemResult]] = [None] * len(operations)
+            chunk = _BatchChunk(current_uid, state, update_times)
+
+            for index, operation in enumerate(operations):
+                note_id = operation.id
+                # A document is written at most once per commit, and the operation
+                # is validated against the committed result of the earlier one
+                if note_id in chunk.note_ids:
+                    await chunk.commit(results)
+                    chunk = _BatchChunk(current_uid, state, update_times)
+
+                current = state.get(note_id)
+                try:
+                    if operation.op == "create":
+                        if current is not None:
+                            raise ValidationError("Note with this ID already exists")
+                        note = NoteCreate(**{**(operation.data or {}), "id": note_id})
+                        note_data = _new_note_data(note, current_uid)
+                        content_fields, chunks = _stored_content(note_data["content"])
+                        stored_data = {field: value for field, value in note_data.items() if field != "content"}
+                        stored_data.update(content_fields)
+                        note_data = _with_chunk_count(note_data, chunks)
+                        writes = 2 + _content_writes(chunks, 0)
+                    elif operation.op == "update":
+                        if current is None:
+                            raise NotFoundError("Note", note_id)
+                        note_update = NoteUpdate(**(operation.data or {}))
+                        _check_expected_version(note_id, current, note_update.expected_version)
+                        update_data = {
+                            **_update_data(note_update),
+                            **_patched_content(note_id, current, note_update),
+                            "version": _next_version(current)
+                        }
+                        note_data = {**current, **update_data}
+                        stored_data = update_data
+                        content_fields, chunks = {}, []
+                        if "content" in update_data:
+                            content_fields, chunks = _stored_content(update_data["content"], update=True)
+                            stored_data = {**update_data, **content_fields}
+                            note_data = _with_chunk_count(note_data, chunks)
+                        writes = 1 + _content_writes(chunks, chunk_count(current))
+                    else:
+                        if current is None:
+                            raise NotFoundError("Note", note_id)
+                        note_data = None
+                        content_fields, chunks = {}, []
+                        writes = 2 + chunk_count(current)
+                except (ValidationError, NotFoundError, ConflictError) as e:
+                    results[index] = _batch_error(operation, e.status_code, e.error_message, e.details)
+                    continue
+                except PydanticValidationError as e:
+                    results[index] = _batch_error(operation, 422, "Invalid note data", _validation_details(e))
+                    continue
+
+                # One write of each chunk is kept for the tag summary
+                content_bytes = _content_bytes(content_fields, chunks)
+                if len(chunk.batch) + writes >= MAX_BATCH_WRITES or (chunk.pending and chunk.content_bytes + content_bytes > MAX_BATCH_BYTES):
+                    await chunk.commit(results)
+                    chunk = _BatchChunk(current_uid, state, update_times)
+                chunk.content_bytes += content_bytes
+
+                doc_ref = user_notes_ref.document(note_id)
+                if operation.op == "create":
+                    chunk.batch.create(doc_ref, stored_data)
+                    chunk.batch.delete(_tombstone_ref(current_uid, note_id))
+                    _write_chunks(chunk.batch, doc_ref, chunks)
+                    chunk.tag_deltas.update(note_data["tags"])
+                elif operation.op == "update":
+                    # Versions are computed from the read state, so the write is conditioned on it
+                    chunk.batch.update(doc_ref, stored_data, option=db.write_option(last_update_time=update_times[note_id]))
+                    if "content" in update_data:
+                        _write_chunks(chunk.batch, doc_ref, chunks, chunk_count(current))
+                else:
+                    chunk.batch.delete(doc_ref, option=db.write_option(last_update_time=update_times[note_id]))
+                    _write_chunks(chunk.batch, doc_ref, [], chunk_count(current))
+                    chunk.batch.set(_tombstone_ref(current_uid, note_id), {"deleted_at": SERVER_TIMESTAMP})
+                    chunk.tag_deltas.subtract(current.get("tags", []))
+                chunk.add(index, operation, note_data)
+
+            await chunk.commit(results)
+            await _invalidate_cache(current_uid)
+            for result in results:
+                if not result.success:
+                    continue
+                if result.data is not None:
+                    search_index.note_written(current_uid, result.id, result.data.title, result.data.content)
+                else:
+                    search_index.note_deleted(current_uid, result.id)
+
+            succeeded = sum(1 for result in results if result.success)
+            logging.info("Applied %s/%s batch operations for user: %s", succeeded, len(operations), current_uid)
+            return results
+        except Exception as e:
+            logging.error("Failed to apply batch for user %s. Error: %s", current_uid, e)
+            raise InternalServerError("Failed to apply batch. Please try again.")
+
+    @staticmethod
+    async def import_notes(records: Iterator[ImportRecord], current_uid: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Create notes from the records of an uploaded archive, yielding progress
+        events as it goes.
+
+        Records are read IMPORT_READ_SIZE at a time, off the event loop, and
+        validated against NoteCreate. The existence of a block's notes is
+        checked in one round-trip. Notes that already exist are skipped, which
+        makes an interrupted import safe to run again. New notes are written in
+        WriteBatch chunks, with up to IMPORT_MAX_PARALLEL_COMMITS commits in
+        flight.
+
+        Events are `error` for each record that was not imported, `progress`
+        after each commit, and a final `summary`. Commits in flight when the
+        client goes away still complete.
+        """
+        user_notes_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
+        totals = {"processed": 0, "created": 0, "skipped": 0, "failed": 0}
+        seen_ids = set()
+        commits = set()
+
+        async def commit(batch, pending: List[Tuple[str, dict]], tag_deltas: Counter) -> List[Dict[str, Any]]:
+            _count_tags(batch, current_uid, tag_deltas)
+            try:
+                await async_db.commit(batch)
+            except google_exceptions.Conflict as e:
+                logging.warning("Import chunk rejected by a concurrent change. Error: %s", e)
+                totals["failed"] += len(pending)
+                return [_import_error(source, note_data["id"], 409, "Note was created concurrently. Run the import again to skip it.") for source, note_data in pending]
+            # Each commit is made visible on its own, even if the client goes away before the end
+            await _invalidate_cache(current_uid)
+            for _, note_data in pending:
+                search_index.note_written(current_uid, note_data["id"], note_data["title"], note_data["content"])
+            totals["created"] += len(pending)
+            return []
+
+        async def finished_commits(wait_for_all: bool) -> AsyncIterator[Dict[str, Any]]:
+            """Events of finished commits, waiting until a commit slot is free, or for all of them."""
+            while commits and (wait_for_all or len(commits) >= settings.IMPORT_MAX_PARALLEL_COMMITS):
+                done, _ = await asyncio.wait(commits, return_when=asyncio.FIRST_COMPLETED)
+                commits.difference_update(done)
+                for task in done:
+                    for event in task.result():
+                        yield event
+                yield {"type": "progress", **totals}
+
+        while True:
+            block = await asyncio.to_thread(take, records, IMPORT_READ_SIZE)
+            if not block:
+                break
+
+            notes: List[Tuple[str, NoteCreate, dict, List[bytes]]] = []
+            for source, record in block:
+                totals["processed"] += 1
+                note_id = record.get("id") if isinstance(record, dict) else None
+                try:
+                    if isinstance(record, RecordError):
+                        raise ValidationError(str(record))
+                    note = NoteCreate(**record)
+                    if note.id in seen_ids:
+                        raise ValidationError("Duplicate note ID in the upload")
+                    # Content too large to store fails only its own record
+                    content_fields, chunks = _stored_content(note.content)
+                except ValidationError as e:
+                    totals["failed"] += 1
+                    yield _import_error(source, note_id, e.status_code, e.error_message, e.details)
+                    continue
+                except PydanticValidationError as e:
+                    totals["failed"] += 1
+                    yield _import_error(source, note_id, 422, "Invalid note data", _validation_details(e))
+                    continue
+                seen_ids.add(note.id)
+                notes.append((source, note, content_fields, chunks))
+            if not notes:
+                continue
+
+            # Only existence matters, so no note data is read
+            snapshots = await async_db.get_all([user_notes_ref.document(note.id) for _, note, _, _ in notes], field_paths=["version"])
+            existing = {doc.id for doc in snapshots if doc.exists}
+            totals["skipped"] += len(existing)
+
+            batch, pending, tag_deltas, content_bytes = db.batch(), [], Counter(), 0
+            for source, note, content_fields, chunks in notes:
+                if note.id in existing:
+                    continue
+                note_data = _new_note_data(note, current_uid)
+                stored_data = {field: value for field, value in note_data.items() if field != "content"}
+                stored_data.update(content_fields)
+                writes = 2 + _content_writes(chunks, 0)
+                note_bytes = _content_bytes(content_fields, chunks)
+
+                # One write of each chunk is kept for the tag summary
+                if pending and (len(batch) + writes >= MAX_BATCH_WRITES or content_bytes + note_bytes > MAX_BATCH_BYTES):
+                    commits.add(asyncio.ensure_future(commit(batch, pending, tag_deltas)))
+                    async for event in finished_commits(False):
+                        yield event
+                    batch, pending, tag_deltas, content_bytes = db.batch(), [], Counter(), 0
+
+                doc_ref = user_notes_ref.document(note.id)
+                batch.create(doc_ref, stored_data)
+                batch.delete(_tombstone_ref(current_uid, note.id))
+                _write_chunks(batch, doc_ref, chunks)
+                tag_deltas.update(note_data["tags"])
+                content_bytes += note_bytes
+                pending.append((source, {"id": note.id, "title": note.title, "content": note.content}))
+
+            if pending:
+                commits.add(asyncio.ensure_future(commit(batch, pending, tag_deltas)))
+                async for event in finished_commits(False):
+                    yield event
+
+        async for event in finished_commits(True):
+            yield event
+        logging.info(
+            "Imported notes for user %s: %s created, %s skipped, %s failed",
+            current_uid, totals["created"], totals["skipped"], totals["failed"]
+        )
+        yield {"type": "summary", **totals}
+
+    @staticmethod
+    async def get_cached_notes_etag(
+        current_uid: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        filters: Optional[NoteFilters] = None,
+        include_content: bool = False
+    ) -> Optional[str]:
+        """ETag of a notes page if it is cached for the user's current data version."""
+        await _settle_writes(current_uid)
+        cached = await note_cache.get(await _list_cache_key(current_uid, limit, cursor, fields, filters or NoteFilters(), include_content))
+        return cached["etag"] if cached is not None else None
+
+    @staticmethod
+    async def get_user_notes(
+        current_uid: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        filters: Optional[NoteFilters] = None,
+        include_content: bool = False
+    ) -> NotesPage:
+        """
+        Get the notes of the logged in user, most recently updated first by default.
+
+        Returns the page of notes, the cursor of the next page (None on the
+        last page) and the page ETag. When `fields` is given only those fields
+        are fetched and each note is returned as a dict. `filters` narrows and
+        orders the listing; filtering happens in the Firestore query, so only
+        the matching notes are read. Large notes are listed with a preview of
+        their content unless `include_content` asks for the full content.
+        Identical requests made while one is in flight share its result.
+        """
+        filters = filters or NoteFilters()
+        await _settle_writes(current_uid)
+        return await note_reads.do(
+            "get_user_notes",
+            current_uid,
+            _list_key(limit, cursor, fields, filters, include_content),
+            lambda: NoteService._read_user_notes(current_uid, limit, cursor, fields, filters, include_content)
+        )
+
+    @staticmethod
+    async def _read_user_notes(
+        current_uid: str,
+        limit: Optional[int],
+        cursor: Optional[str],
+        fields: Optional[List[str]],
+        filters: NoteFilters,
+        include_content: bool
+    ) -> NotesPage:
+        try:
+            if fields is not None:
+                unknown_fields = [field for field in fields if field not in NOTE_FIELDS]
+                if unknown_fields:
+                    raise ValidationError("Unknown fields requested", {"fields": unknown_fields})
+
+            cache_key = await _list_cache_key(current_uid, limit, cursor, fields, filters, include_content)
+            cached = await note_cache.get(cache_key)
+            if cached is not None:
+                logging.info("Retrieved %s cached notes for user: %s", len(cached['notes']), current_uid)
+                return NotesPage.model_construct(**cached)
+
+            # Query nested collection: notes/{userId}/userNotes
+            query = _notes_query(current_uid, filters)
+            if fields is not None:
+                # The next cursor and the ETag are built from these fields, so they are always fetched
+                selected = {field for field in fields if field not in ("id", "content", "content_truncated")}
+                if "content" in fields:
+                    selected |= set(CONTENT_STORAGE_FIELDS) if include_content else {"content", "content_preview", "content_encoding"}
+                if "content_truncated" in fields:
+                    selected.add("content_encoding")
+                query = query.select(sorted(selected | {filters.sort, "created_at", "version"}))
+            elif not include_content:
+                # Leave the compressed content of large notes out of the read
+                query = query.select(LIST_FIELDS)
+            if cursor:
+                query = query.start_after(_decode_cursor(cursor, filters))
+            if limit is not None:
+                # Fetch one extra note to find out whether another page exists
+                query = query.limit(limit + 1)
+
+            docs = await async_db.stream(query)
+
+            next_cursor = None
+            if limit is not None and len(docs) > limit:
+                docs = docs[:limit]
+                next_cursor = _encode_cursor(docs[-1], filters)
+
+            if include_content and (fields is None or "content" in fields):
+                loaded = await asyncio.gather(*(_load_note(doc) for doc in docs))
+            else:
+                loaded = [doc.to_dict() for doc in docs]
+
+            notes = []
+            note_etags = []
+            for doc, note_data in zip(docs, loaded):
+                if fields is not None:
+                    notes.append(_project_note(doc.id, note_data, fields))
+                    note_etags.append(note_etag(doc.id, note_data["created_at"].isoformat(), note_data.get("version", NOTE_FIELD_DEFAULTS["version"])))
+                    continue
+
+                note = serialize_note(doc.id, note_data)
+                notes.append(note)
+                note_etags.append(note_etag(doc.id, note["created_at"], note["version"]))
+
+            # The projection, the filters and previews are part of the representation, so they are part of the ETag
+            etag = collection_etag(note_etags + [
+                next_cursor or "",
+                ",".join(fields) if fields is not None else "*",
+                _filters_key(filters),
+                "content" if include_content else "preview"
+            ])
+            page = {"notes": notes, "next_cursor": next_cursor, "etag": etag}
+            await note_cache.set(cache_key, page)
             
-            logging.info(f"Retrieved {len(notes)} notes for user: {current_uid}")
-            return notes
+            logging.info("Retrieved %s notes for user: %s", len(notes), current_uid)
+            return NotesPage.model_construct(**page)
+        except ValidationError:
+            raise
         except Exception as e:
-            logging.error(f"Failed to retrieve notes for user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to retrieve notes for user %s. Error: %s", current_uid, e)
             raise InternalServerError("Failed to retrieve notes. Please try again.")
 
+    @staticmethod
+    async def export_notes(current_uid: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every note of the user, serialized, reading Firestore one page at a time.
+
+        The next page is fetched while the current one is being consumed, so
+        memory stays bounded by two pages whatever the size of the account.
+        """
+        await _settle_writes(current_uid)
+        user_notes_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
+        query = user_notes_ref.order_by("__name__").limit(EXPORT_PAGE_SIZE)
+
+        exported = 0
+        next_page = asyncio.ensure_future(async_db.stream(query))
+        try:
+            while next_page is not None:
+                docs = await next_page
+                next_page = None
+                if len(docs) == EXPORT_PAGE_SIZE:
+                    next_page = asyncio.ensure_future(async_db.stream(query.start_after({"__name__": docs[-1].id})))
+
+                for doc, note_data in zip(docs, await asyncio.gather(*(_load_note(doc) for doc in docs))):
+                    yield serialize_note(doc.id, note_data)
+                exported += len(docs)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+        logging.info("Exported %s notes for user: %s", exported, current_uid)
+
+    @staticmethod
+    async def get_changes(current_uid: str, since: Optional[datetime] = None) -> NoteChangesPage:
+        """
+        Get the notes changed and deleted after the `since` watermark.
+
+        Changes are tracked through `last_synced_at`, which every write moves to
+        the server time, and deletions through tombstones. The returned watermark
+        is the latest server timestamp seen and is passed back as `since` on the
+        next sync. Without `since` every note is returned.
+        """
+        try:
+            await _settle_writes(current_uid)
+            user_ref = db.collection(NOTES_COLLECTION).document(current_uid)
+            notes_query = user_ref.collection(USER_NOTES_SUBCOLLECTION)
+            if since is None:
+                docs = await async_db.stream(notes_query)
+                tombstones = []
+            else:
+                since = _as_utc(since)
+                notes_query = notes_query.where(filter=FieldFilter("last_synced_at", ">", since))
+                tombstones_query = user_ref.collection(DELETED_NOTES_SUBCOLLECTION).where(
+                    filter=FieldFilter("deleted_at", ">", since)
+                )
+                docs, tombstones = await asyncio.gather(
+                    async_db.stream(notes_query),
+                    async_db.stream(tombstones_query)
+                )
+
+            watermark = since
+            notes = []
+            # Clients sync full notes, so large content is reassembled
+            for doc, note_data in zip(docs, await asyncio.gather(*(_load_note(doc) for doc in docs))):
+                notes.append(serialize_note(doc.id, note_data))
+                if watermark is None or note_data["last_synced_at"] > watermark:
+                    watermark = note_data["last_synced_at"]
+
+            deleted = []
+            for tombstone in tombstones:
+                deleted_at = tombstone.get("deleted_at")
+                deleted.append({"id": tombstone.id, "deleted_at": deleted_at.isoformat()})
+                if watermark is None or deleted_at > watermark:
+                    watermark = deleted_at
+
+            logging.info("Retrieved %s changed and %s deleted notes for user: %s", len(notes), len(deleted), current_uid)
+            return NoteChangesPage.model_construct(
+                notes=notes,
+                deleted=deleted,
+                watermark=watermark.isoformat() if watermark else None
+            )
+        except Exception as e:
+            logging.error("Failed to retrieve changes for user %s. Error: %s", current_uid, e)
+            raise InternalServerError("Failed to retrieve changes. Please try again.")
+
+    @staticmethod
+    async def search_notes(current_uid: str, query: str, limit: int = 20, offset: int = 0) -> NoteSearchPage:
+        """
+        Search the user's notes by title and content, best matches first.
+
+        Matching and ranking run on the user's in-memory index; only the notes
+        of the requested page are read from Firestore, in one round-trip.
+        """
+        try:
+            await _settle_writes(current_uid)
+            index = await search_index.get(current_uid, _load_search_changes)
+            ranked = index.search(query)
+            page = ranked[offset:offset + limit]
+
+            notes = []
+            if page:
+                user_notes_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION)
+                # Results are listed like the notes listing, with previews of large notes
+                docs = await async_db.get_all([user_notes_ref.document(note_id) for note_id, _ in page], field_paths=LIST_FIELDS)
+                docs_by_id = {doc.id: doc for doc in docs if doc.exists}
+                for note_id, score in page:
+                    # Skip notes deleted by another worker since the last index sync
+                    doc = docs_by_id.get(note_id)
+                    if doc is not None:
+                        notes.append({**serialize_note(note_id, doc.to_dict()), "score": round(score, 4)})
+
+            next_offset = offset + limit if offset + limit < len(ranked) else None
+            logging.info("Found %s notes matching search for user: %s", len(ranked), current_uid)
+            return NoteSearchPage.model_construct(notes=notes, total=len(ranked), next_offset=next_offset)
+        except Exception as e:
+            logging.error("Failed to search notes for user %s. Error: %s", current_uid, e)
+            raise InternalServerError("Failed to search notes. Please try again.")
+
+    @staticmethod
+    def stream_changes(current_uid: str, last_event_id: Optional[str] = None) -> AsyncIterator[Optional[dict]]:
+        """
+        Real-time create/update/delete events of the user's notes.
+
+        Events missed since `last_event_id` are replayed first. None is yielded
+        as a keep-alive when the stream has been idle.
+        """
+        return change_feed.events(current_uid, last_event_id, _catch_up_events)
+
     @staticmethod
     async def get_note_by_id(note_id: str, current_uid: str) -> NoteResponse:
-        """Get a specific note by ID for the logged in user."""
+        """
+        Get a specific note by ID for the logged in user, sharing the result of
+        an identical read in flight. A note with buffered updates is returned
+        as they left it.
+        """
+        if note_writes is not None:
+            pending = note_writes.pending_note(current_uid, note_id)
+            if pending is not None:
+                return _to_note_response(note_id, pending)
+        return await note_reads.do("get_note_by_id", current_uid, note_id, lambda: NoteService._read_note(note_id, current_uid))
+
+    @staticmethod
+    async def _read_note(note_id: str, current_uid: str) -> NoteResponse:
         try:
+            cache_key = f"{await _cache_prefix(current_uid)}:note:{note_id}"
+            cached = await note_cache.get(cache_key)
+            if cached is not None:
+                logging.info("Retrieved cached note %s for user: %s", note_id, current_uid)
+                return NoteResponse.model_construct(**cached)
+
             # Access nested collection: notes/{userId}/userNotes/{noteId}
             doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
-            doc = doc_ref.get()
+            doc = await async_db.get(doc_ref)
             
             if not doc.exists:
-                logging.warning(f"Note {note_id} not found for user {current_uid}")
+                logging.warning("Note %s not found for user %s", note_id, current_uid)
                 raise NotFoundError("Note", note_id)
             
-            note_data = doc.to_dict()
-            note_response = NoteResponse(
-                id=doc.id,
-                title=note_data["title"],
-                content=note_data["content"],
-                owner_uid=note_data["owner_uid"],
-                is_favorite=note_data["is_favorite"],
-                tags=note_data["tags"],
-                sync_status=note_data["sync_status"],
-                last_synced_at=note_data["last_synced_at"].isoformat(),
-                created_at=note_data["created_at"].isoformat(),
-                updated_at=note_data["updated_at"].isoformat()
-            )
+            note_data = await _load_note(doc)
+            note = serialize_note(doc.id, note_data)
+            await note_cache.set(cache_key, note)
+            note_response = NoteResponse.model_construct(**note)
             
-            logging.info(f"Retrieved note {note_id} for user: {current_uid}")
+            logging.info("Retrieved note %s for user: %s", note_id, current_uid)
             return note_response
         except (NotFoundError, ForbiddenError):
             raise
         except Exception as e:
-            logging.error(f"Failed to retrieve note {note_id} for user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to retrieve note %s for user %s. Error: %s", note_id, current_uid, e)
             raise InternalServerError("Failed to retrieve note. Please try again.")
 
     @staticmethod
-    async def update_note(note_id: str, note_update: NoteUpdate, current_uid: str) -> NoteResponse:
-        """Update the note with the specified ID."""
+    async def update_note(
+        note_id: str,
+        note_update: NoteUpdate,
+        current_uid: str,
+        if_match: Optional[str] = None,
+        flush: bool = False
+    ) -> NoteResponse:
+        """
+        Update the note with the specified ID and bump its version.
+
+        With `expected_version` (or an If-Match ETag) the update only applies
+        if the note is still in that state; otherwise a ConflictError carries
+        the server copy. The write is conditioned on the update time of the
+        snapshot it was checked against, so the check and the version bump
+        act as one conditional write, together with the content chunks of a
+        large note.
+
+        With write-behind enabled the update is buffered and merged with the
+        other updates of the note in the window instead; `flush` writes the
+        buffered updates before returning.
+        """
+        if note_writes is not None:
+            return await NoteService._buffer_update(note_id, note_update, current_uid, if_match, flush)
         try:
             # Access nested collection: notes/{userId}/userNotes/{noteId}
             doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                logging.warning(f"Note {note_id} not found for user {current_uid}")
-                raise NotFoundError("Note", note_id)
             
             # No need to check owner_uid since we're already in the user's collection
-            update_data = note_update.dict(exclude_unset=True)
-            if not update_data:
-                raise ValidationError("No fields to update")
+            update_data = _update_data(note_update)
 
-            # Only update updated_at if content-related fields are being updated
-            if "title" in update_data or "content" in update_data:
-                update_data["updated_at"] = SERVER_TIMESTAMP
-            
-            doc_ref.update(update_data)
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                doc = await async_db.get(doc_ref)
+
+                if not doc.exists:
+                    logging.warning("Note %s not found for user %s", note_id, current_uid)
+                    raise NotFoundError("Note", note_id)
+
+                note_data = await _load_note(doc)
+                _check_expected_version(note_id, note_data, note_update.expected_version, if_match)
+                write_data = {
+                    **update_data,
+                    **_patched_content(note_id, note_data, note_update, if_match),
+                    "version": _next_version(note_data)
+                }
+
+                batch = db.batch()
+                if "content" in write_data:
+                    content_fields, chunks = _stored_content(write_data["content"], update=True)
+                    batch.update(doc_ref, {**write_data, **content_fields}, option=db.write_option(last_update_time=doc.update_time))
+                    _write_chunks(batch, doc_ref, chunks, chunk_count(note_data))
+                    note_data = _with_chunk_count(note_data, chunks)
+                else:
+                    batch.update(doc_ref, write_data, option=db.write_option(last_update_time=doc.update_time))
+                try:
+                    await async_db.commit(batch)
+                    break
+                except google_exceptions.FailedPrecondition:
+                    # A conditional update finds the conflict on the next read
+                    logging.info("Note %s changed during update, retrying", note_id)
+            else:
+                raise ConflictError("Note is being modified concurrently. Please try again.")
+            await _invalidate_cache(current_uid)
             
-            updated_doc = doc_ref.get()
-            updated_note_data = updated_doc.to_dict()
-            updated_note = NoteResponse(
-                id=updated_doc.id,
-                title=updated_note_data["title"],
-                content=updated_note_data["content"],
-                owner_uid=updated_note_data["owner_uid"],
-                is_favorite=updated_note_data["is_favorite"],
-                tags=updated_note_data["tags"],
-                sync_status=updated_note_data["sync_status"],
-                last_synced_at=updated_note_data["last_synced_at"].isoformat(),
-                created_at=updated_note_data["created_at"].isoformat(),
-                updated_at=updated_note_data["updated_at"].isoformat()
-            )
+            # Build the response from the read snapshot and the applied change
+            updated_note_data = _resolve_server_timestamps({**note_data, **write_data}, batch.commit_time)
+            updated_note = _to_note_response(note_id, updated_note_data)
+            search_index.note_written(current_uid, note_id, updated_note.title, updated_note.content)
             
-            logging.info(f"Updated note {note_id} for user: {current_uid}")
+            logging.info("Updated note %s to version %s for user: %s", note_id, write_data['version'], current_uid)
             return updated_note
-        except (NotFoundError, ForbiddenError, ValidationError):
+        except (NotFoundError, ForbiddenError, ValidationError, ConflictError):
+            raise
+        except Exception as e:
+            logging.error("Failed to update note %s for user %s. Error: %s", note_id, current_uid, e)
+            raise InternalServerError("Failed to update note. Please try again.")
+
+    @staticmethod
+    async def _buffer_update(
+        note_id: str,
+        note_update: NoteUpdate,
+        current_uid: str,
+        if_match: Optional[str],
+        flush: bool
+    ) -> NoteResponse:
+        """
+        Apply an update to the buffered state of a note, read from Firestore
+        for its first buffered update, and leave the write to the buffer.
+
+        Version checks run against the buffered state, so a client can chain
+        autosaves with `expected_version` as if each one had been written.
+        """
+        try:
+            update_data = _update_data(note_update)
+            while True:
+                pending = note_writes.entry(current_uid, note_id)
+                async with pending.lock:
+                    # Flushed while this update waited for the lock
+                    if pending.closed:
+                        continue
+
+                    try:
+                        if pending.note_data is None:
+                            doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
+                            doc = await async_db.get(doc_ref)
+                            if not doc.exists:
+                                logging.warning("Note %s not found for user %s", note_id, current_uid)
+                                raise NotFoundError("Note", note_id)
+                            pending.rebase(await _load_note(doc), doc.update_time)
+
+                        note_data = pending.note_data
+                        _check_expected_version(note_id, note_data, note_update.expected_version, if_match)
+                        write_data = {
+                            **update_data,
+                            **_patched_content(note_id, note_data, note_update, if_match),
+                            "version": _next_version(note_data)
+                        }
+                        if "content" in write_data:
+                            # Reject content that could never be written now, not at the flush
+                            _stored_content(write_data["content"], update=True)
+                    except BaseException:
+                        # A rejected first update leaves nothing to write; drop the snapshot it read
+                        if not pending.write_data:
+                            note_writes.discard(pending)
+                        raise
+
+                    # A patch always carries one of these guards
+                    if note_update.expected_version is not None or if_match is not None or note_update.base_content_hash is not None:
+                        pending.guarded = True
+                    pending.write_data.update(write_data)
+                    pending.note_data = _resolve_server_timestamps({**note_data, **write_data}, datetime.now(timezone.utc))
+                    note_writes.buffered(pending, len(pending.note_data["content"]))
+                    note_data = pending.note_data
+                break
+
+            if flush or not note_writes.has_room():
+                note_data = await note_writes.flush_pending(pending)
+                if note_data is None:
+                    raise pending.error
+                logging.info("Flushed note %s at version %s for user: %s", note_id, note_data["version"], current_uid)
+            else:
+                logging.info("Buffered update of note %s to version %s for user: %s", note_id, write_data["version"], current_uid)
+            return _to_note_response(note_id, note_data)
+        except (NotFoundError, ForbiddenError, ValidationError, ConflictError):
             raise
         except Exception as e:
-            logging.error(f"Failed to update note {note_id} for user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to update note %s for user %s. Error: %s", note_id, current_uid, e)
             raise InternalServerError("Failed to update note. Please try again.")
 
     @staticmethod
     async def delete_note(note_id: str, current_uid: str) -> None:
-        """Delete the note with the specified ID."""
+        """
+        Delete the note with the specified ID.
+
+        The note is read first to take its tags out of the tag summary; the
+        delete is conditioned on that read, so a concurrent tag change cannot
+        leave the summary out of step, and is retried from a fresh read.
+        """
         try:
+            await _settle_note(current_uid, note_id)
             # Access nested collection: notes/{userId}/userNotes/{noteId}
             doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
-            doc = doc_ref.get()
-
-            if not doc.exists:
-                logging.warning(f"Note {note_id} not found for user {current_uid}")
-                raise NotFoundError("Note", note_id)
 
             # No need to check owner_uid since we're already in the user's collection
-            doc_ref.delete()
-            logging.info(f"Deleted note {note_id} for user: {current_uid}")
-        except (NotFoundError, ForbiddenError):
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                doc = await async_db.get(doc_ref)
+
+                if not doc.exists:
+                    logging.warning("Note %s not found for user %s", note_id, current_uid)
+                    raise NotFoundError("Note", note_id)
+
+                # Leave a tombstone so other devices learn about the deletion on their next sync
+                batch = db.batch()
+                note_data = doc.to_dict()
+                batch.delete(doc_ref, option=db.write_option(last_update_time=doc.update_time))
+                batch.set(_tombstone_ref(current_uid, note_id), {"deleted_at": SERVER_TIMESTAMP})
+                _write_chunks(batch, doc_ref, [], chunk_count(note_data))
+                _count_tags(batch, current_uid, {tag: -1 for tag in note_data.get("tags", [])})
+                try:
+                    await async_db.commit(batch)
+                    break
+                except google_exceptions.FailedPrecondition:
+                    logging.info("Note %s changed during delete, retrying", note_id)
+            else:
+                raise ConflictError("Note is being modified concurrently. Please try again.")
+            await _invalidate_cache(current_uid)
+            search_index.note_deleted(current_uid, note_id)
+            logging.info("Deleted note %s for user: %s", note_id, current_uid)
+        except (NotFoundError, ForbiddenError, ConflictError):
             raise
         except Exception as e:
-            logging.error(f"Failed to delete note {note_id} for user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to delete note %s for user %s. Error: %s", note_id, current_uid, e)
             raise InternalServerError("Failed to delete note. Please try again.")
 
     @staticmethod
     async def toggle_favorite(note_id: str, current_uid: str) -> NoteResponse:
-        """Toggle favorite status of a note."""
+        """
+        Toggle favorite status of a note.
+
+        The write is conditioned on the update time of the snapshot it was
+        computed from, so concurrent toggles cannot overwrite each other; a
+        rejected write is retried from a fresh read.
+        """
         try:
+            await _settle_note(current_uid, note_id)
             # Access nested collection: notes/{userId}/userNotes/{noteId}
             doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                logging.warning(f"Note {note_id} not found for user {current_uid}")
-                raise NotFoundError("Note", note_id)
-            
-            # Toggle the favorite status
-            current_favorite = doc.to_dict()["is_favorite"]
-            new_favorite = not current_favorite
-            
-            doc_ref.update({
-                "is_favorite": new_favorite
-            })
+
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                doc = await async_db.get(doc_ref)
+                
+                if not doc.exists:
+                    logging.warning("Note %s not found for user %s", note_id, current_uid)
+                    raise NotFoundError("Note", note_id)
+                
+                # Toggle the favorite status
+                note_data = await _load_note(doc)
+                new_favorite = not note_data["is_favorite"]
+                update_data = {
+                    "is_favorite": new_favorite,
+                    "version": _next_version(note_data),
+                    "last_synced_at": SERVER_TIMESTAMP
+                }
+                
+                try:
+                    write_result = await async_db.update(
+                        doc_ref,
+                        update_data,
+                        option=db.write_option(last_update_time=doc.update_time)
+                    )
+                    break
+                except google_exceptions.FailedPrecondition:
+                    logging.info("Note %s changed during favorite toggle, retrying", note_id)
+            else:
+                raise ConflictError("Note is being modified concurrently. Please try again.")
+            await _invalidate_cache(current_uid)
             
-            # Get updated note data
-            updated_doc = doc_ref.get()
-            updated_note_data = updated_doc.to_dict()
-            updated_note = NoteResponse(
-                id=updated_doc.id,
-                title=updated_note_data["title"],
-                content=updated_note_data["content"],
-                owner_uid=updated_note_data["owner_uid"],
-                is_favorite=updated_note_data["is_favorite"],
-                tags=updated_note_data["tags"],
-                sync_status=updated_note_data["sync_status"],
-                last_synced_at=updated_note_data["last_synced_at"].isoformat(),
-                created_at=updated_note_data["created_at"].isoformat(),
-                updated_at=updated_note_data["updated_at"].isoformat()
-            )
+            # Build the response from the read snapshot and the applied change
+            updated_note_data = _resolve_server_timestamps({**note_data, **update_data}, write_result.update_time)
+            updated_note = _to_note_response(note_id, updated_note_data)
             
             action = "added to" if new_favorite else "removed from"
-            logging.info(f"Note {note_id} {action} favorites for user: {current_uid}")
+            logging.info("Note %s %s favorites for user: %s", note_id, action, current_uid)
             return updated_note
-        except (NotFoundError, ForbiddenError):
+        except (NotFoundError, ForbiddenError, ConflictError):
             raise
         except Exception as e:
-            logging.error(f"Failed to toggle favorite for note {note_id} and user {current_uid}. Error: {str(e)}")
+            logging.error("Failed to toggle favorite for note %s and user %s. Error: %s", note_id, current_uid, e)
             raise InternalServerError("Failed to toggle favorite. Please try again.")
+
+    @staticmethod
+    async def change_tags(
+        note_id: str,
+        current_uid: str,
+        add: Optional[List[str]] = None,
+        remove: Optional[List[str]] = None
+    ) -> NoteResponse:
+        """
+        Add and remove tags of a note and keep the user's tag summary in step.
+
+        Like toggle_favorite, the write is conditioned on the update time of the
+        snapshot it was computed from and retried from a fresh read when the
+        note changed in between. Adding a present tag or removing a missing one
+        is a no-op.
+        """
+        try:
+            await _settle_note(current_uid, note_id)
+            # Access nested collection: notes/{userId}/userNotes/{noteId}
+            doc_ref = db.collection(NOTES_COLLECTION).document(current_uid).collection(USER_NOTES_SUBCOLLECTION).document(note_id)
+
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                doc = await async_db.get(doc_ref)
+
+                if not doc.exists:
+                    logging.warning("Note %s not found for user %s", note_id, current_uid)
+                    raise NotFoundError("Note", note_id)
+
+                note_data = await _load_note(doc)
+                current_tags = note_data.get("tags", [])
+                new_tags = [tag for tag in current_tags if tag not in (remove or [])]
+                new_tags += [tag for tag in (add or []) if tag not in new_tags]
+                if len(new_tags) > MAX_TAGS_PER_NOTE:
+                    raise ValidationError(f"A note can have at most {MAX_TAGS_PER_NOTE} tags")
+                if new_tags == current_tags:
+                    return _to_note_response(note_id, note_data)
+
+                update_data = {
+                    "tags": new_tags,
+                    "version": _next_version(note_data),
+                    "last_synced_at": SERVER_TIMESTAMP
+                }
+                deltas = {tag: 1 for tag in new_tags if tag not in current_tags}
+                deltas.update({tag: -1 for tag in current_tags if tag not in new_tags})
+
+                batch = db.batch()
+                batch.update(doc_ref, update_data, option=db.write_option(last_update_time=doc.update_time))
+                _count_tags(batch, current_uid, deltas)
+                try:
+                    await async_db.commit(batch)
+                    break
+                except google_exceptions.FailedPrecondition:
+                    logging.info("Note %s changed during tag update, retrying", note_id)
+            else:
+                raise ConflictError("Note is being modified concurrently. Please try again.")
+            await _invalidate_cache(current_uid)
+
+            # Build the response from the read snapshot and the applied change
+            updated_note = _to_note_response(note_id, _resolve_server_timestamps({**note_data, **update_data}, batch.commit_time))
+
+            logging.info("Updated tags of note %s for user: %s", note_id, current_uid)
+            return updated_note
+        except (NotFoundError, ForbiddenError, ValidationError, ConflictError):
+            raise
+        except Exception as e:
+            logging.error("Failed to update tags of note %s for user %s. Error: %s", note_id, current_uid, e)
+            raise InternalServerError("Failed to update tags. Please try again.")
+
+    @staticmethod
+    async def get_tag_counts(current_uid: str) -> List[Dict[str, Any]]:
+        """
+        Get every tag of the user with the number of notes carrying it, most used first.
+
+        Counts come from the tag summary maintained by the note writes, so this
+        is a single document read whatever the number of notes.
+        """
+        try:
+            cache_key = f"{await _cache_prefix(current_uid)}:tags"
+            cached = await note_cache.get(cache_key)
+            if cached is not None:
+                logging.info("Retrieved cached tag counts for user: %s", current_uid)
+                return cached
+
+            doc = await async_db.get(_tag_counts_ref(current_uid))
+            counts = (doc.to_dict() or {}).get("counts", {}) if doc.exists else {}
+            # Tags whose last note was untagged or deleted keep a zero count
+            tag_counts = [
+                {"tag": tag, "count": count}
+                for tag, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+                if count > 0
+            ]
+            await note_cache.set(cache_key, tag_counts)
+
+            logging.info("Retrieved %s tags for user: %s", len(tag_counts), current_uid)
+            return tag_counts
+        except Exception as e:
+            logging.error("Failed to retrieve tags for user %s. Error: %s", current_uid, e)
+            raise InternalServerError("Failed to retrieve tags. Please try again.")
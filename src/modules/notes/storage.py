@@ -0,0 +1,73 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# Fields holding the stored representation of the content; exactly one layout is used per note:
+#   small notes:  content
+#   large notes:  content_encoding, content_preview, content_length and either
+#                 content_zlib (compressed bytes inline) or content_chunks (number of chunk documents)
+CONTENT_STORAGE_FIELDS = ("content", "content_encoding", "content_preview", "content_length", "content_zlib", "content_chunks")
+CONTENT_ENCODING = "zlib"
+CONTENT_PREVIEW_LENGTH = 200  # Characters of a large note's content returned by listings
+CHUNK_BYTES = 512 * 1024  # Compressed bytes per chunk document, well below the 1 MiB document limit
+COMPRESSION_LEVEL = 6
+
+
+def encode_content(content: str, compression_threshold: int, inline_max_bytes: int) -> Tuple[Dict[str, object], List[bytes]]:
+    """
+    Stored representation of note content: the fields of the note document and its chunks.
+
+    Content smaller than `compression_threshold` bytes is stored as is. Larger
+    content is zlib-compressed and kept in the note document while the
+    compressed size stays within `inline_max_bytes`; beyond that it is split
+    into chunks stored as separate documents.
+    """
+    raw = content.encode("utf-8")
+    if len(raw) < compression_threshold:
+        return {"content": content}, []
+
+    compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+    fields: Dict[str, object] = {
+        "content_encoding": CONTENT_ENCODING,
+        "content_preview": content[:CONTENT_PREVIEW_LENGTH],
+        "content_length": len(content)
+    }
+    if len(compressed) <= inline_max_bytes:
+        fields["content_zlib"] = compressed
+        return fields, []
+
+    chunks = [compressed[start:start + CHUNK_BYTES] for start in range(0, len(compressed), CHUNK_BYTES)]
+    fields["content_chunks"] = len(chunks)
+    return fields, chunks
+
+
+def is_stored_large(note_data: dict) -> bool:
+    """Whether a stored note keeps its content compressed, out of the `content` field."""
+    return "content_encoding" in note_data
+
+
+def chunk_count(note_data: dict) -> int:
+    return note_data.get("content_chunks", 0)
+
+
+def decode_content(note_data: dict, chunks: Optional[List[bytes]] = None) -> str:
+    """Reassemble the content of a stored note; chunked notes need their chunks, in order."""
+    if not is_stored_large(note_data):
+        return note_data["content"]
+    if note_data["content_encoding"] != CONTENT_ENCODING:
+        raise ValueError(f"Unknown content encoding: {note_data['content_encoding']}")
+    compressed = b"".join(chunks) if chunk_count(note_data) else note_data["content_zlib"]
+    return zlib.decompress(compressed).decode("utf-8")
+
+
+def materialize(note_data: dict, content: str) -> dict:
+    """
+    The note with its content inline, as the rest of the service handles it.
+
+    The storage fields are dropped except `content_chunks`, which writes need
+    to clean up chunks the new content no longer uses.
+    """
+    note = {field: value for field, value in note_data.items() if field not in CONTENT_STORAGE_FIELDS}
+    note["content"] = content
+    if chunk_count(note_data):
+        note["content_chunks"] = chunk_count(note_data)
+    return note
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from src.core.response import serialize_note
+
+# Event type sent for each Firestore document change type
+EVENT_TYPES = {"ADDED": "created", "MODIFIED": "updated", "REMOVED": "deleted"}
+SUBSCRIBER_QUEUE_SIZE = 1000
+LISTENER_START_TIMEOUT = 30  # Seconds to wait for the initial snapshot of a new listener
+
+
+def event_id(read_time: datetime, position: int) -> str:
+    """Resumable ID of an event: the snapshot read time and the position of the change in it."""
+    return f"{read_time.isoformat()}#{position}"
+
+
+def parse_event_id(value: str) -> Tuple[datetime, int]:
+    """Turn an event ID back into its position; raises ValueError for IDs not made by event_id."""
+    read_time, _, position = value.rpartition("#")
+    parsed = datetime.fromisoformat(read_time)
+    if parsed.tzinfo is None:
+        raise ValueError("Event ID without a time zone")
+    return parsed, int(position)
+
+
+class _Subscriber:
+    """One open stream of a user; overflows when it falls too far behind the feed."""
+
+    def __init__(self):
+        self.queue: "asyncio.Queue[Optional[Tuple[Tuple[datetime, int], dict]]]" = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, event: Tuple[Tuple[datetime, int], dict]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue = asyncio.Queue(1)
+            self.queue.put_nowait(None)
+
+
+class _UserFeed:
+    """
+    The shared snapshot listener of one user and the recent events it produced.
+
+    `horizon` is the position from which the ring buffer holds every event;
+    it is set, and `ready` fires, once the listener delivers its initial snapshot.
+    """
+
+    def __init__(self, buffer_size: int):
+        self.ready = asyncio.Event()
+        self.subscribers: List[_Subscriber] = []
+        self.buffer: "deque[Tuple[Tuple[datetime, int], dict]]" = deque(maxlen=buffer_size)
+        self.horizon: Optional[Tuple[datetime, int]] = None
+        self.watch = None
+        self.started: Optional[asyncio.Future] = None  # Start of the snapshot listener, awaited by every stream
+
+    def publish(self, read_time: datetime, changes: List[Tuple[str, str, Optional[dict]]]) -> None:
+        """Record the changes of one snapshot and fan them out; runs on the event loop."""
+        if self.horizon is None:
+            # The initial snapshot lists the existing notes, which clients already have
+            self.horizon = (read_time, 0)
+            self.ready.set()
+            return
+
+        for position, (change_type, note_id, note) in enumerate(changes):
+            key = (read_time, position)
+            event = {"id": event_id(read_time, position), "event": EVENT_TYPES[change_type], "data": note or {"id": note_id}}
+            if len(self.buffer) == self.buffer.maxlen:
+                self.horizon = self.buffer[0][0]
+            self.buffer.append((key, event))
+            for subscriber in self.subscribers:
+                subscriber.push((key, event))
+
+
+# Reads the changes made after a time: events for changed and deleted notes
+CatchUpLoader = Callable[[str, datetime], Awaitable[List[dict]]]
+
+
+class NoteChangeFeed:
+    """
+    Real-time note change events for the connected users.
+
+    Each user with at least one open stream has a single Firestore snapshot
+    listener on their notes, shared by all of their streams and stopped when
+    the last one closes. The listener runs on a Firestore thread and hands
+    its changes to the event loop with call_soon_threadsafe.
+
+    A reconnecting client sends the ID of the last event it received. Events
+    still in the user's ring buffer are replayed from memory; older positions
+    are caught up through delta sync, so a resume never misses a change.
+    Delivery is at least once.
+    """
+
+    def __init__(self, notes_collection: Callable[[str], Any], buffer_size: int, heartbeat_seconds: float):
+        self.notes_collection = notes_collection
+        self.buffer_size = buffer_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self._feeds: Dict[str, _UserFeed] = {}
+
+    async def _subscribe(self, current_uid: str) -> Tuple[_UserFeed, _Subscriber]:
+        subscriber = _Subscriber()
+        feed = self._feeds.get(current_uid)
+        if feed is None:
+            feed = _UserFeed(self.buffer_size)
+            self._feeds[current_uid] = feed
+            feed.started = asyncio.ensure_future(self._start_listener(current_uid, feed))
+            # Mark a failure retrieved when every stream waiting on it has gone away
+            feed.started.add_done_callback(lambda started: started.cancelled() or started.exception())
+        feed.subscribers.append(subscriber)
+        try:
+            # Streams that join while the listener is starting share its outcome
+            await asyncio.shield(feed.started)
+        except BaseException:
+            await self._unsubscribe(current_uid, feed, subscriber)
+            raise
+        return feed, subscriber
+
+    async def _start_listener(self, current_uid: str, feed: _UserFeed) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_snapshot(_, changes, read_time) -> None:
+            # Called on a Firestore thread
+            note_changes = [
+                (
+                    change.type.name,
+                    change.document.id,
+                    serialize_note(change.document.id, change.document.to_dict()) if change.type.name != "REMOVED" else None
+                )
+                for change in changes
+            ]
+            loop.call_soon_threadsafe(feed.publish, read_time, note_changes)
+
+        try:
+            watch = await asyncio.to_thread(self.notes_collection(current_uid).on_snapshot, on_snapshot)
+        except Exception:
+            # Every waiting stream fails with the error; the next stream starts a new listener
+            if self._feeds.get(current_uid) is feed:
+                del self._feeds[current_uid]
+            feed.subscribers.clear()
+            raise
+
+        if self._feeds.get(current_uid) is not feed:
+            # Every stream closed, or the feed was shut down, while the listener was starting
+            await asyncio.to_thread(watch.unsubscribe)
+            return
+        feed.watch = watch
+        logging.info("Started note listener for user: %s", current_uid)
+
+    async def _unsubscribe(self, current_uid: str, feed: _UserFeed, subscriber: _Subscriber) -> None:
+        if subscriber not in feed.subscribers:
+            # Dropped when the listener failed to start
+            return
+        feed.subscribers.remove(subscriber)
+        if feed.subscribers or self._feeds.get(current_uid) is not feed:
+            return
+
+        del self._feeds[current_uid]
+        if feed.watch is not None:
+            await asyncio.to_thread(feed.watch.unsubscribe)
+        logging.info("Stopped note listener for user: %s", current_uid)
+
+    async def events(
+        self,
+        current_uid: str,
+        last_event_id: Optional[str],
+        catch_up: CatchUpLoader
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield the user's change events, after replaying those missed since `last_event_id`.
+
+        None is yielded when no event arrived for `heartbeat_seconds`, so the
+        caller can keep the connection alive. A subscriber that falls too far
+        behind gets a final `resync` event and has to resync with delta sync.
+        """
+        feed, subscriber = await self._subscribe(current_uid)
+        try:
+            last_key = None
+            if last_event_id:
+                last_key = parse_event_id(last_event_id)
+                # Changes folded into the initial snapshot are only covered by the catch-up read if it comes after it
+                await asyncio.wait_for(feed.ready.wait(), LISTENER_START_TIMEOUT)
+                if last_key >= feed.horizon:
+                    missed = [(key, event) for key, event in feed.buffer if key > last_key]
+                else:
+                    missed = [(parse_event_id(event["id"]), event) for event in await catch_up(current_uid, last_key[0])]
+                for key, event in missed:
+                    yield event
+                    # Live events up to here were queued meanwhile and are skipped below
+                    last_key = max(last_key, key)
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                if item is None:
+                    yield {"id": None, "event": "resync", "data": {"reason": "Stream fell behind. Resync with /api/notes/changes."}}
+                    return
+                key, event = item
+                # Skip events already sent during the replay
+                if last_key is not None and key <= last_key:
+                    continue
+                yield event
+        finally:
+            await self._unsubscribe(current_uid, feed, subscriber)
+
+    def close(self) -> None:
+        """Stop every listener."""
+        for feed in self._feeds.values():
+            if feed.watch is not None:
+                feed.watch.unsubscribe()
+        self._feeds.clear()
+
+    def stats(self) -> dict:
+        return {
+            "active_users": len(self._feeds),
+            "connections": sum(len(feed.subscribers) for feed in self._feeds.values())
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class PendingNote:
+    """
+    Buffered updates of one note.
+
+    `note_data` is the note with every buffered update applied, as reads
+    should see it. `write_data` holds the merged field updates that the next
+    flush writes in one commit, conditioned on `base_update_time`, the update
+    time of the stored note they were applied to. `guarded` is set once any
+    of them was conditional on the state it saw, which rules out applying
+    them over a change made elsewhere.
+    """
+
+    def __init__(self, current_uid: str, note_id: str):
+        self.current_uid = current_uid
+        self.note_id = note_id
+        self.lock = asyncio.Lock()  # Held while an update is applied or the note is flushed
+        self.note_data: Optional[dict] = None
+        self.write_data: Dict[str, Any] = {}
+        self.base_update_time = None
+        self.updates = 0
+        self.size = 0
+        self.guarded = False
+        self.error: Optional[Exception] = None  # Why the updates were dropped, for callers waiting on the flush
+        self.closed = False  # Flushed and dropped from the buffer; holders must start over
+        self.timer: Optional[asyncio.Task] = None
+
+    def rebase(self, note_data: dict, update_time) -> None:
+        """Apply the buffered updates to this stored state of the note from now on."""
+        self.note_data = note_data
+        self.base_update_time = update_time
+
+    def drop(self, error: Exception) -> None:
+        """Give up the buffered updates, which can no longer be written."""
+        self.write_data = {}
+        self.note_data = None
+        self.error = error
+
+
+class WriteBehindBuffer:
+    """
+    Merges rapid successive updates of a note into one Firestore write.
+
+    The first buffered update of a note starts a timer of `window` seconds;
+    updates arriving before it fires are merged into the same pending write.
+    Flushing writes the merged fields through `write`. A failed timed flush
+    keeps the updates and tries again after another window. The buffer is
+    bounded by `max_notes` and `max_bytes` of content; `has_room` tells
+    callers when to write through instead.
+    """
+
+    def __init__(self, write: Callable[[PendingNote], Awaitable[None]], window: float, max_notes: int, max_bytes: int):
+        self.write = write
+        self.window = window
+        self.max_notes = max_notes
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.updates = 0
+        self.flushes = 0
+        self.dropped = 0
+        self._notes: Dict[str, Dict[str, PendingNote]] = {}  # uid -> note ID -> pending note
+
+    def entry(self, current_uid: str, note_id: str) -> PendingNote:
+        """The pending note to apply an update to, created if the note has none."""
+        notes = self._notes.setdefault(current_uid, {})
+        pending = notes.get(note_id)
+        if pending is None:
+            pending = notes[note_id] = PendingNote(current_uid, note_id)
+        return pending
+
+    def pending_note(self, current_uid: str, note_id: str) -> Optional[dict]:
+        """The note as its buffered updates left it, or None if it has none."""
+        pending = self._notes.get(current_uid, {}).get(note_id)
+        if pending is None or not pending.write_data:
+            return None
+        return pending.note_data
+
+    def has_room(self) -> bool:
+        return sum(len(notes) for notes in self._notes.values()) <= self.max_notes and self.size <= self.max_bytes
+
+    def buffered(self, pending: PendingNote, size: int) -> None:
+        """Record an update applied to a pending note, and start its flush timer."""
+        self.size += size - pending.size
+        pending.size = size
+        pending.updates += 1
+        self.updates += 1
+        if pending.timer is None:
+            pending.timer = asyncio.create_task(self._flush_later(pending))
+
+    def discard(self, pending: PendingNote) -> None:
+        """Drop a pending note that has nothing to write."""
+        pending.closed = True
+        self._remove(pending)
+
+    async def _flush_later(self, pending: PendingNote) -> None:
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush_pending(pending)
+        except Exception as e:
+            logging.error("Failed to write buffered updates of note %s. Error: %s", pending.note_id, e)
+            if not pending.closed:
+                pending.timer = asyncio.create_task(self._flush_later(pending))
+
+    async def flush_pending(self, pending: PendingNote) -> Optional[dict]:
+        """Write the buffered updates of a note now; returns the note as written, or None if they were dropped."""
+        async with pending.lock:
+            if not pending.closed:
+                if pending.write_data:
+                    await self.write(pending)
+                    if pending.error is not None:
+                        self.dropped += 1
+                    else:
+                        self.flushes += 1
+                pending.closed = True
+                self._remove(pending)
+            return pending.note_data
+
+    async def flush(self, current_uid: str, note_id: str) -> None:
+        pending = self._notes.get(current_uid, {}).get(note_id)
+        if pending is not None:
+            await self.flush_pending(pending)
+
+    async def flush_user(self, current_uid: str) -> None:
+        """Write the buffered updates of every note of the user, before reads or writes that span notes."""
+        notes = self._notes.get(current_uid)
+        if notes:
+            await asyncio.gather(*(self.flush_pending(pending) for pending in list(notes.values())))
+
+    async def flush_all(self) -> None:
+        """Write every buffered update, at shutdown. Failures are logged; they cannot be retried later."""
+        pending_notes = [pending for notes in self._notes.values() for pending in notes.values()]
+        results = await asyncio.gather(*(self.flush_pending(pending) for pending in pending_notes), return_exceptions=True)
+        for pending, result in zip(pending_notes, results):
+            if isinstance(result, Exception):
+                logging.error("Lost buffered updates of note %s for user %s. Error: %s", pending.note_id, pending.current_uid, result)
+
+    def _remove(self, pending: PendingNote) -> None:
+        notes = self._notes.get(pending.current_uid)
+        if notes is not None and notes.get(pending.note_id) is pending:
+            del notes[pending.note_id]
+            self.size -= pending.size
+            if not notes:
+                del self._notes[pending.current_uid]
+        if pending.timer is not None and pending.timer is not asyncio.current_task():
+            pending.timer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "pending_notes": sum(len(notes) for notes in self._notes.values()),
+            "pending_bytes": self.size,
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "window_seconds": self.window
+        }
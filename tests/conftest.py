@@ -0,0 +1,35 @@
+"""
+Shared fixtures. The tests run against the in-memory Firestore and Auth
+backend, so they need neither credentials nor network access.
+"""
+import os
+import tempfile
+import uuid
+
+# Settings are read at import time, so these are set before the app is imported
+os.environ.setdefault("FIREBASE_BACKEND", "fake")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+os.environ.setdefault("SEARCH_INDEX_DIR", tempfile.mkdtemp(prefix="notes-search-"))
+
+import pytest
+from fastapi.testclient import TestClient
+from src.main import create_app
+
+
+@pytest.fixture
+def client():
+    with TestClient(create_app()) as client:
+        yield client
+
+
+@pytest.fixture
+def uid() -> str:
+    """A fresh user, so tests never see each other's notes."""
+    return f"user-{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def headers(uid: str) -> dict:
+    # The fake Auth backend accepts the uid itself as the ID token
+    return {"Authorization": f"Bearer {uid}"}
@@ -0,0 +1,42 @@
+import logging
+import threading
+from src.modules.notes.search import SearchIndex, UserIndex
+
+
+class SlowIndex(UserIndex):
+    """An index whose snapshot is only produced once `release` is set, to hold a save mid-write."""
+
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def to_snapshot(self) -> dict:
+        self.writing.set()
+        assert self.release.wait(5)
+        return super().to_snapshot()
+
+
+def test_workers_saving_the_same_user_leave_a_whole_snapshot(tmp_path, caplog):
+    caplog.set_level(logging.WARNING)
+    # Two workers sharing the snapshot directory, each with its own copy of the user's index
+    first_worker, second_worker = (SearchIndex(str(tmp_path), max_users=10, sync_interval=60) for _ in range(2))
+    slow = SlowIndex()
+    slow.add("note-0", "alpha", "alpha content")
+    fast = UserIndex()
+    for position in range(50):
+        fast.add(f"note-{position}", "beta", "beta content")
+
+    # The first save opens its file and waits while the second one writes and publishes its snapshot
+    first_save = threading.Thread(target=first_worker._write_snapshot, args=("user-1", slow))
+    first_save.start()
+    assert slow.writing.wait(5)
+    second_worker._write_snapshot("user-1", fast)
+    slow.release.set()
+    first_save.join()
+
+    snapshot = first_worker._read_snapshot("user-1")
+    assert snapshot is not None
+    assert len(snapshot.notes) == 1
+    assert "Failed to save search snapshot" not in caplog.text
+    assert [path.name for path in tmp_path.iterdir()] == ["user-1.json"]
@@ -0,0 +1,149 @@
+import time
+import pytest
+from src.core.firebase import async_db
+from src.modules.notes import service
+from src.modules.notes.write_behind import WriteBehindBuffer
+
+WINDOW_SECONDS = 0.2
+
+
+@pytest.fixture
+def note_writes(monkeypatch) -> WriteBehindBuffer:
+    buffer = WriteBehindBuffer(service._write_pending, WINDOW_SECONDS, 1000, 1024 * 1024)
+    monkeypatch.setattr(service, "note_writes", buffer)
+    return buffer
+
+
+@pytest.fixture
+def note_id(client, headers) -> str:
+    response = client.post("/api/notes/", json={"id": "note-1", "title": "Title", "content": "v0"}, headers=headers)
+    assert response.status_code == 201
+    return "note-1"
+
+
+def stored_note(uid: str, note_id: str) -> dict:
+    return service.db.collection(service.NOTES_COLLECTION).document(uid).collection(service.USER_NOTES_SUBCOLLECTION).document(note_id).get().to_dict()
+
+
+def change_elsewhere(uid: str, note_id: str, **fields) -> None:
+    """Write to the note as another worker would, bypassing this worker's buffer."""
+    stored = stored_note(uid, note_id)
+    service.db.collection(service.NOTES_COLLECTION).document(uid).collection(service.USER_NOTES_SUBCOLLECTION).document(note_id).update(
+        {**fields, "version": stored["version"] + 1}
+    )
+
+
+def wait_for_flush() -> None:
+    time.sleep(WINDOW_SECONDS * 3)
+
+
+def test_updates_within_the_window_are_written_once(client, headers, uid, note_id, note_writes):
+    round_trips = async_db.round_trips
+    for position in range(1, 6):
+        response = client.put(f"/api/notes/{note_id}", json={"content": f"v{position}"}, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["data"]["version"] == position + 1
+
+    # Reads see the buffered state before it is written
+    assert client.get(f"/api/notes/{note_id}", headers=headers).json()["data"]["content"] == "v5"
+    assert stored_note(uid, note_id)["version"] == 1
+
+    wait_for_flush()
+    stored = stored_note(uid, note_id)
+    assert (stored["content"], stored["version"]) == ("v5", 6)
+    # One read of the note for the first update, one commit for all of them
+    assert async_db.round_trips - round_trips == 2
+    assert note_writes.stats()["pending_notes"] == 0
+    assert note_writes.stats()["flushes"] == 1
+
+
+def test_flush_writes_before_responding(client, headers, uid, note_id, note_writes):
+    client.put(f"/api/notes/{note_id}", json={"content": "draft"}, headers=headers)
+    response = client.put(f"/api/notes/{note_id}?flush=true", json={"title": "Saved"}, headers=headers)
+
+    assert response.status_code == 200
+    stored = stored_note(uid, note_id)
+    assert (stored["title"], stored["content"], stored["version"]) == ("Saved", "draft", 3)
+    assert note_writes.stats()["pending_notes"] == 0
+
+
+def test_listing_writes_buffered_updates_first(client, headers, note_id, note_writes):
+    client.put(f"/api/notes/{note_id}", json={"title": "Renamed"}, headers=headers)
+
+    notes = client.get("/api/notes/", headers=headers).json()["data"]
+    assert [note["title"] for note in notes] == ["Renamed"]
+    assert note_writes.stats()["pending_notes"] == 0
+
+
+def test_etag_of_a_buffered_update_holds_after_the_flush(client, headers, note_id, note_writes):
+    etag = client.put(f"/api/notes/{note_id}", json={"content": "draft"}, headers=headers).headers["ETag"]
+    wait_for_flush()
+
+    response = client.put(f"/api/notes/{note_id}", json={"content": "next"}, headers={**headers, "If-Match": etag})
+    assert response.status_code == 200
+
+
+def test_unconditional_updates_are_applied_over_a_change_elsewhere(client, headers, uid, note_id, note_writes):
+    client.put(f"/api/notes/{note_id}", json={"content": "mine"}, headers=headers)
+    change_elsewhere(uid, note_id, title="Theirs")
+
+    response = client.put(f"/api/notes/{note_id}?flush=true", json={"is_favorite": True}, headers=headers)
+
+    assert response.status_code == 200
+    stored = stored_note(uid, note_id)
+    assert (stored["title"], stored["content"], stored["is_favorite"], stored["version"]) == ("Theirs", "mine", True, 3)
+    assert response.json()["data"]["version"] == 3
+
+
+def test_conditional_updates_are_dropped_over_a_change_elsewhere(client, headers, uid, note_id, note_writes):
+    response = client.put(f"/api/notes/{note_id}", json={"content": "mine", "expected_version": 1}, headers=headers)
+    assert response.status_code == 200
+    change_elsewhere(uid, note_id, content="theirs")
+
+    wait_for_flush()
+    stored = stored_note(uid, note_id)
+    assert (stored["content"], stored["version"]) == ("theirs", 2)
+    assert note_writes.stats()["dropped"] == 1
+
+
+def test_flush_reports_a_dropped_conditional_update(client, headers, uid, note_id, note_writes):
+    client.put(f"/api/notes/{note_id}", json={"content": "mine", "expected_version": 1}, headers=headers)
+    change_elsewhere(uid, note_id, content="theirs")
+
+    response = client.put(f"/api/notes/{note_id}?flush=true", json={"title": "Saved"}, headers=headers)
+
+    assert response.status_code == 409
+    assert response.json()["details"]["server_note"]["content"] == "theirs"
+    assert stored_note(uid, note_id)["content"] == "theirs"
+
+
+def test_rejected_first_update_is_not_kept(client, headers, uid, note_id, note_writes):
+    response = client.put(f"/api/notes/{note_id}", json={"content": "stale", "expected_version": 7}, headers=headers)
+    assert response.status_code == 409
+    assert note_writes.stats()["pending_notes"] == 0
+
+    change_elsewhere(uid, note_id, content="theirs")
+    # Checked against the stored note, not the snapshot the rejected update read
+    assert client.put(f"/api/notes/{note_id}", json={"content": "old", "expected_version": 1}, headers=headers).status_code == 409
+    response = client.put(f"/api/notes/{note_id}", json={"content": "retry", "expected_version": 2}, headers=headers)
+    assert response.status_code == 200
+
+    wait_for_flush()
+    stored = stored_note(uid, note_id)
+    assert (stored["content"], stored["version"]) == ("retry", 3)
+    assert note_writes.stats()["dropped"] == 0
+
+
+def test_invalid_first_update_is_not_kept(client, headers, note_id, note_writes):
+    # A content patch needs a guard
+    response = client.patch(f"/api/notes/{note_id}", json={"content_patch": [{"start": 0, "end": 0, "text": "x"}]}, headers=headers)
+
+    assert response.status_code == 400
+    assert note_writes.stats()["pending_notes"] == 0
+
+
+def test_missing_note_is_not_kept(client, headers, note_writes):
+    response = client.put("/api/notes/missing", json={"content": "x"}, headers=headers)
+
+    assert response.status_code == 404
+    assert note_writes.stats()["pending_notes"] == 0